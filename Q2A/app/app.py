@@ -36,6 +36,10 @@ app.register_blueprint(booking)
 app.register_blueprint(package)
 # NO loan_bp here - this is Q2A!
 
+# CLI commands (flask bench-catalog)
+from app.commands import register_commands
+register_commands(app)
+
 @app.template_filter('formatdate')
 def format_date(value, format="%#d/%m/%Y"):
     """Format a date time to (Default): dd/mm/YYYY"""
@@ -0,0 +1,76 @@
+import click
+import random
+import statistics
+import time
+import tracemalloc
+
+from models.catalog import CatalogIndex, summarize
+
+CATEGORIES = ('Adult', 'Children', 'Teens')
+GENRES = ('Fiction', 'Fantasy', 'Romance', 'Mystery', 'Nonfiction', 'Poetry', 'Comics')
+
+
+def synthetic_books(count, seed=0):
+    """all_books-shaped dicts with random titles, for benchmarking."""
+    rng = random.Random(seed)
+    words = ['river', 'night', 'garden', 'stone', 'winter', 'letters', 'crown', 'harbour', 'silver', 'fox']
+    return [{
+        'title': f"{' '.join(rng.choices(words, k=3)).title()} {i}",
+        'authors': [f"Author {rng.randrange(count // 5 + 1)}"],
+        'category': rng.choice(CATEGORIES),
+        'genres': rng.sample(GENRES, 2),
+        'pages': rng.randrange(50, 900),
+        'url': "",
+        'copies': 2,
+        'available': 2,
+        'description': [f"Paragraph {p} of book {i}." for p in range(rng.randrange(1, 6))],
+    } for i in range(count)]
+
+
+def scan_book_titles(books, category):
+    """What book_titles did per request before the catalog index."""
+    filtered = books if category == 'All' else [b for b in books if b['category'] == category]
+    sorted_books = sorted(filtered, key=lambda b: b['title'].lower())
+    for book in sorted_books:
+        book['short_description'] = summarize(book.get('description', []))
+    return sorted_books
+
+
+def timed(fn, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def register_commands(app):
+
+    @app.cli.command('bench-catalog')
+    @click.option('--sizes', default='10000,100000', help='Comma-separated catalog sizes.')
+    @click.option('--runs', default=20, help='Timed runs per measurement.')
+    def bench_catalog(sizes, runs):
+        """Compare book_titles / viewBookDetail: per-request scan and sort vs the prebuilt CatalogIndex."""
+        for size in [int(s) for s in sizes.split(',')]:
+            books = synthetic_books(size)
+            title = books[-1]['title']
+
+            start = time.perf_counter()
+            index = CatalogIndex(books)
+            build_ms = (time.perf_counter() - start) * 1000
+            # Memory is measured on a second build; tracing would distort the timing above
+            tracemalloc.start()
+            traced = CatalogIndex(books)
+            index_kib = tracemalloc.get_traced_memory()[0] / 1024
+            tracemalloc.stop()
+            del traced
+
+            click.echo(f"{size} titles: index built in {build_ms:.0f} ms, {index_kib:.0f} KiB")
+            for category in ('All', 'Teens'):
+                scan = timed(lambda: scan_book_titles(books, category), runs)
+                indexed = timed(lambda: index.titles(category), runs)
+                click.echo(f"  book_titles({category}): scan+sort {scan:.2f} ms, index {indexed:.4f} ms")
+            scan = timed(lambda: next((b for b in books if b['title'] == title), None), runs)
+            indexed = timed(lambda: index.get(title), runs)
+            click.echo(f"  viewBookDetail (last title): scan {scan:.2f} ms, index {indexed:.4f} ms")
@@ -0,0 +1,81 @@
+from types import MappingProxyType
+
+from models.books import all_books
+
+RECORD_FIELDS = ('title', 'authors', 'category', 'genres', 'pages', 'url', 'copies', 'available',
+                 'description', 'short_description')
+
+
+def summarize(description):
+    """Keep only the first and last paragraphs of a description."""
+    if len(description) > 1:
+        return f"{description[0]}\n\n{description[-1]}"
+    elif description:
+        return description[0]
+    return "No description available."
+
+
+class BookRecord:
+    """Read-only copy of one all_books entry with its short description worked out up front."""
+    __slots__ = RECORD_FIELDS
+
+    def __init__(self, book):
+        description = tuple(book.get('description', []))
+        values = {
+            'title': book['title'],
+            'authors': tuple(book.get('authors', [])),
+            'category': book.get('category'),
+            'genres': tuple(book.get('genres', [])),
+            'pages': book.get('pages'),
+            'url': book.get('url'),
+            'copies': book.get('copies'),
+            'available': book.get('available'),
+            'description': description,
+            'short_description': summarize(description),
+        }
+        for field, value in values.items():
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"BookRecord is read-only (tried to set {name!r})")
+
+    def __getitem__(self, field):
+        # Templates written for the dicts use book['title']
+        if field not in RECORD_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+
+class CatalogIndex:
+    """
+    all_books indexed once: a title -> record map and, per category, the
+    records presorted by lower-cased title. Lookups never copy, sort or
+    change anything, so requests share it without locking.
+    """
+    __slots__ = ('by_title', 'by_category')
+
+    def __init__(self, books):
+        records = [BookRecord(book) for book in books]
+        by_title = {}
+        for record in records:
+            by_title.setdefault(record.title, record)  # first match, as the old linear scan found
+        ordered = sorted(records, key=lambda record: record.title.lower())
+        by_category = {'All': ordered}
+        for record in ordered:
+            by_category.setdefault(record.category, []).append(record)
+        object.__setattr__(self, 'by_title', MappingProxyType(by_title))
+        object.__setattr__(self, 'by_category',
+                           MappingProxyType({category: tuple(books) for category, books in by_category.items()}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CatalogIndex is read-only; build a new one instead")
+
+    def titles(self, category='All'):
+        """Books in a category, sorted by title (an empty tuple for an unknown category)."""
+        return self.by_category.get(category, ())
+
+    def get(self, title):
+        return self.by_title.get(title)
+
+
+catalog = CatalogIndex(all_books)
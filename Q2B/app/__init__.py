@@ -1,9 +1,14 @@
 from flask import Flask
 from flask_mongoengine import MongoEngine
 from flask_login import LoginManager
+from jinja2 import FileSystemBytecodeCache
 import os
 
-def create_app():
+from app.config import get_config
+from app.database import configure_mongo
+from app.logging_setup import configure_logging
+
+def create_app(config_name=None):
     # Get the absolute path to the app directory
     app_dir = os.path.dirname(os.path.abspath(__file__))
     
@@ -12,28 +17,15 @@ def create_app():
                 template_folder=os.path.join(app_dir, 'templates'),
                 static_folder=os.path.join(app_dir, 'assets'))
     
-    # MongoDB Configuration
-    app.config['MONGODB_SETTINGS'] = {
-        'db':'q2b_library',  # ← Q2B database
-        'host':'localhost'
-    }
-    
-    # Secret key
-    app.config['SECRET_KEY'] = '9OLWxND4o83j4K4iuopO'
-    
-    # AGGRESSIVE CACHE DISABLING
-    app.config['TEMPLATES_AUTO_RELOAD'] = True
-    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
-    app.config['DEBUG'] = True
-    app.config['EXPLAIN_TEMPLATE_LOADING'] = True
+    # Settings profile (development/production) chosen by APP_CONFIG
+    app.config.from_object(get_config(config_name))
+    configure_logging(app)
     
-    # Initialize MongoDB
+    # Initialize MongoDB (pool, timeouts, compression and monitoring from config)
+    configure_mongo(app)
     db = MongoEngine(app)
     
-    # Disable ALL Jinja2 caching
-    app.jinja_env.auto_reload = True
-    app.jinja_env.cache = {}
-    app.jinja_env.bytecode_cache = None
+    configure_jinja(app)
     
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -41,10 +33,27 @@ def create_app():
     login_manager.login_view = 'auth.login'
     login_manager.login_message = "Please login or register first to get an account."
     
-    # Debug: Print template folder location
-    print(f"📁 Template folder: {app.template_folder}")
-    print(f"📁 Static folder: {app.static_folder}")
+    app.logger.debug('Template folder: %s, static folder: %s', app.template_folder, app.static_folder)
     
     return app, db, login_manager
 
-app, db, login_manager = create_app()
\ No newline at end of file
+def configure_jinja(app):
+    if not app.config['JINJA_CACHE_ENABLED']:
+        # Disable ALL Jinja2 caching
+        app.jinja_env.auto_reload = True
+        app.jinja_env.cache = {}
+        app.jinja_env.bytecode_cache = None
+        return
+
+    app.jinja_env.auto_reload = app.config['TEMPLATES_AUTO_RELOAD']
+    cache_dir = app.config['JINJA_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+def precompile_templates(app):
+    """Load every template once so the first requests don't pay for compiling them."""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+app, db, login_manager = create_app()
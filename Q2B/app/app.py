@@ -1,39 +1,25 @@
-print("="*60)
-print("THIS IS Q2B - PART B")
-print("="*60)
-
 from flask_login import login_required, current_user
 from flask import Blueprint, render_template, request, jsonify, url_for, redirect
-from app import app, db
+from app import app, db, precompile_templates
 from app.controllers.loanController import (loan_bp)
 app.register_blueprint(loan_bp)
+from app.controllers.jobController import job_bp
+app.register_blueprint(job_bp)
 
-# Debug: Print which database we're connected to
-print("="*60)
-print(f"🚀 Running: Q2b - Part (b)")
-print(f"🗄️  Connected to database: {app.config['MONGODB_SETTINGS']['db']}")
-print(f"🌐 URL: http://127.0.0.1:5000")
-print("="*60)
-
-from werkzeug.security import generate_password_hash
+app.logger.info('Starting Q2B - Part (b)', extra={'database': app.config['MONGODB_SETTINGS']['db']})
 
 # Register Blueprint
 from app.controllers.dashboard import dashboard
-from app.controllers.auth import auth
+from app.controllers.auth import auth, remember_user
 from app.controllers.bookController import booking
 from app.controllers.packageController import package 
 
-from app.models.package import Package
-from app.models.book import Booking
 from app.models.users import User
 from app.models.forms import BookForm
 
 # For uploading file
-import csv
-import io
-import json
-import datetime as dt
-import os
+from app.importer import IMPORTERS
+from app.jobs import submit_import, start_overdue_sweeps
 
 # Register blueprints
 app.register_blueprint(dashboard)
@@ -41,6 +27,29 @@ app.register_blueprint(auth)
 app.register_blueprint(booking)
 app.register_blueprint(package)
 
+# CLI commands (flask seed-books)
+from app.commands import register_commands
+register_commands(app)
+
+# Fingerprinted static files (flask build-assets) and the asset_url() template helper
+from app.static_assets import init_assets, asset_url
+init_assets(app)
+
+# Avatar registry and picker thumbnails (flask build-avatars)
+from app.avatars import init_avatars, avatar_registry
+init_avatars(app)
+
+# Server-Timing header, /metrics and the slow-request log
+from app.instrumentation import init_instrumentation
+init_instrumentation(app)
+
+# Background sweep that flips loans past their due date to 'overdue'
+start_overdue_sweeps(app)
+
+# Process pool for hashing imported passwords (created here, not from a job thread)
+from app.passwords import init_hash_pool
+init_hash_pool()
+
 @app.template_filter('formatdate')
 def format_date(value, format="%#d/%m/%Y"):
     """Format a date time to (Default): dd/mm/YYYY"""
@@ -67,61 +76,44 @@ def upload():
     elif request.method == 'POST':
         type = request.form.get('type')
         if type == 'create':
-            print("No create Action yet")
+            app.logger.warning('Upload form posted the unimplemented create action')
         elif type == 'upload':
             file = request.files.get('file')
             datatype = request.form.get('datatype')
 
-            data = file.read().decode('utf-8')
-            dict_reader = csv.DictReader(io.StringIO(data), delimiter=',', quotechar='"')
-            file.close()
+            if file is None or datatype not in IMPORTERS:
+                return render_template("upload.html", panel="Upload", error="Choose a CSV file and data type.")
 
-            if datatype == "Users":
-                for item in list(dict_reader):
-                    pwd = generate_password_hash(item['password'], method='sha256')
-                    User.createUser(email=item['email'], password=pwd, name=item['name'])
-            elif datatype == "Package":
-                for item in list(dict_reader):
-                    Package.createPackage(hotel_name=item['hotel_name'], duration=int(item['duration']),
-                        unit_cost=float(item['unit_cost']), image_url=item['image_url'],
-                        description=item['description'])
-            elif datatype == "Booking":
-                for item in list(dict_reader):
-                    existing_user = User.getUser(email=item['customer'])
-                    existing_package = Package.getPackage(hotel_name=item['hotel_name'])
-                    check_in_date=dt.datetime.strptime(item['check_in_date'], "%Y-%m-%d")
-
-                    aBooking = Booking.createBooking(check_in_date=check_in_date, customer=existing_user, package=existing_package)
-                    aBooking.calculate_total_cost()
+            # The import runs as a background job; upload.html polls /jobs/<id> for progress
+            job = submit_import(file, datatype, owner=current_user.id)
+            file.close()
+            return render_template("upload.html", panel="Upload", job_id=str(job.id))
                     
         return render_template("upload.html", panel="Upload")
     
 @app.route("/changeAvatar")
 def changeAvatar():
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    subfolder_path = os.path.join('assets', 'img/avatar')
-    subfolder_abs_path = os.path.join(basedir, subfolder_path)
-    
-    files = []
-    for filename in os.listdir(subfolder_abs_path):
-        path = os.path.join(subfolder_abs_path, filename)
-        if os.path.isfile(path):
-            files.append(filename)
-    return render_template("changeAvatar.html", filenames=files, panel="Change Avatar") 
+    # Listing and versions come from the avatar registry (re-scanned only when the folder changes)
+    return render_template("changeAvatar.html", avatars=avatar_registry.versions(), panel="Change Avatar") 
 
 @app.route("/chooseAvatar", methods=['POST'])
+@login_required
 def chooseAvatar():
-    chosenPath = request.json['path']
-    print('chosen path: ', chosenPath)
-  
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    subfolder_path = os.path.join('assets', 'img/avatar')
-    subfolder_abs_path = os.path.join(basedir, subfolder_path)
+    # Older clients post the image path; only the filename matters
+    filename = request.json.get('filename') or request.json.get('path', '').split('/')[-1]
+    app.logger.debug('Avatar chosen', extra={'avatar': filename, 'user_id': str(current_user.id)})
+
+    if filename not in avatar_registry:
+        return jsonify(error='Unknown avatar.'), 400
     
-    filename = chosenPath.split('/')[-1]
     User.addAvatar(current_user, filename)
+    remember_user(current_user)  # keep the session snapshot's avatar current
     
-    return jsonify(path=chosenPath)
+    return jsonify(path=asset_url('img/avatar/' + filename))
+
+# Production profile: compile every template now rather than on first request
+if app.config['PRECOMPILE_TEMPLATES']:
+    precompile_templates(app)
 
 if __name__ == '__main__':
-    app.run(debug=True, host='127.0.0.1', port=5000)  
\ No newline at end of file
+    app.run(debug=app.config['DEBUG'], host='127.0.0.1', port=5000)  
\ No newline at end of file
@@ -59,7 +59,7 @@ def upload():
     elif request.method == 'POST':
         type = request.form.get('type')
         if type == 'create':
-            print("No create Action yet")
+            app.logger.warning('Upload form posted the unimplemented create action')
         elif type == 'upload':
             file = request.files.get('file')
             datatype = request.form.get('datatype')
@@ -84,7 +84,6 @@ def upload():
                     check_in_date=dt.datetime.strptime(item['check_in_date'], "%Y-%m-%d")
 
                     aBooking = Booking.createBooking(check_in_date=check_in_date, customer=existing_user, package=existing_package)
-                    aBooking.calculate_total_cost()
                     
         return render_template("upload.html", panel="Upload")
     
@@ -14,7 +14,7 @@ $(document).ready(function () {
                 type: 'POST',
                 url: '/chooseAvatar',
                 contentType: "application/json",
-                data: JSON.stringify({ path: document.getElementById("img" + matches[i].id).src }),
+                data: JSON.stringify({ filename: document.getElementById("img" + matches[i].id).dataset.filename }),
                 error: function () {
                     alert("Error");
                 },
@@ -0,0 +1,46 @@
+// Polls an import job started from upload.html and shows its progress
+
+var statusUrl = $("#job-panel").attr("data-status-url");
+
+function showJob(job) {
+    var panel = $("#job-panel");
+    $("#job-summary").text(
+        job.status + ": " + job.processed + " rows read, " + job.inserted + " inserted, " +
+        job.skipped + " skipped, " + job.failed + " failed." + (job.error ? " " + job.error : ""));
+
+    var errors = $("#job-errors").empty();
+    for (let i = 0; i < job.errors.length; i++) {
+        let line = job.errors[i].line ? "Line " + job.errors[i].line + ": " : "";
+        errors.append($("<li>").text(line + job.errors[i].message));
+    }
+
+    var finished = ["done", "failed", "cancelled"].includes(job.status);
+    panel.toggleClass("alert-info", !finished);
+    panel.toggleClass("alert-success", job.status == "done" && job.failed == 0);
+    panel.toggleClass("alert-warning", finished && (job.status != "done" || job.failed > 0));
+    $("#job-cancel").toggle(!finished);
+    $("#job-retry").toggle(finished && job.failed > 0);
+    return finished;
+}
+
+function poll() {
+    $.getJSON(statusUrl, function(job) {
+        if (!showJob(job)) {
+            setTimeout(poll, 1000);
+        }
+    });
+}
+
+$("#job-cancel").click(function() {
+    $.post(statusUrl + "/cancel", function(job) { showJob(job); });
+});
+
+$("#job-retry").click(function() {
+    $.post(statusUrl + "/retry", function(job) {
+        statusUrl = job.status_url;
+        showJob(job);
+        poll();
+    });
+});
+
+poll();
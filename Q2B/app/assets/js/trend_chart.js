@@ -4,6 +4,19 @@ debugger
 // Retrieve email id from element with id 'myChart'
 // var email_id = $("#myChart").attr("email_id")
 
+// The chart is built by a background job: POST starts it, then poll its status
+function pollTrendJob(statusUrl) {
+  $.getJSON(statusUrl, function(job) {
+    if (job.status == "done") {
+      drawChart(job.result);
+    } else if (job.status == "failed" || job.status == "cancelled") {
+      alert("Error: " + (job.error || job.status));
+    } else {
+      setTimeout(function() { pollTrendJob(statusUrl); }, 500);
+    }
+  });
+}
+
 $.ajax({
     url:"/trend_chart",
     type:"POST",
@@ -12,10 +25,17 @@ $.ajax({
         alert("Error");
     },
   success: function(data, status, xhr) {
+    pollTrendJob(data.status_url);
+  }
+})
+
+function drawChart(data) {
 
     var chartDim = {};
-      
-    var chartDim = data.chartDim; 
+    // job result: series = [{'hotel': name, 'points': [[date, cost], ...]}, ...]
+    for (const s of data.series) {
+      chartDim[s.hotel] = s.points;
+    }
     var xLabels = data.labels;
 
     // # New Output 
@@ -110,5 +130,4 @@ $.ajax({
       });
       myChart.update();
     }
-}
-})
\ No newline at end of file
+}
\ No newline at end of file
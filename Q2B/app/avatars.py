@@ -0,0 +1,132 @@
+# Avatar registry: the files in assets/img/avatar and their mtimes are scanned
+# once and re-scanned when the directory's mtime changes (files added, removed
+# or renamed) or, to pick up files overwritten in place, at most every
+# RESCAN_SECONDS. Thumbnails (JPEG and WebP) are generated on first use, or all
+# at once by `flask build-avatars`, into instance/avatars and regenerated when
+# the source file is newer.
+from flask import Blueprint, send_from_directory, url_for, abort
+import os
+import threading
+import time
+
+try:
+    from PIL import Image
+except ImportError:  # optional: without Pillow the picker shows full-size images
+    Image = None
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+AVATAR_DIR = os.path.join(APP_DIR, 'assets', 'img', 'avatar')
+THUMB_DIR = os.path.join(APP_DIR, 'instance', 'avatars')
+THUMB_SIZE = (160, 160)
+THUMB_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+AVATAR_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp')
+# An in-place overwrite doesn't change the directory mtime; rescan this often anyway
+RESCAN_SECONDS = 60
+
+
+class AvatarRegistry:
+
+    def __init__(self, directory=AVATAR_DIR, thumb_dir=THUMB_DIR):
+        self.directory = directory
+        self.thumb_dir = thumb_dir
+        self._mtime = None
+        self._scanned_at = 0.0
+        self._files = {}  # filename -> source mtime
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        mtime = os.stat(self.directory).st_mtime
+        if mtime == self._mtime and time.monotonic() - self._scanned_at < RESCAN_SECONDS:
+            return
+        with self._lock:
+            files = {}
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.lower().endswith(AVATAR_EXTENSIONS):
+                        files[entry.name] = entry.stat().st_mtime
+            self._files = files
+            self._mtime = mtime
+            self._scanned_at = time.monotonic()
+
+    def filenames(self):
+        self._refresh()
+        return sorted(self._files)
+
+    def versions(self):
+        """(filename, version) for every avatar, from one refresh of the cached listing."""
+        self._refresh()
+        files = self._files
+        return [(filename, int(files[filename])) for filename in sorted(files)]
+
+    def __contains__(self, filename):
+        self._refresh()
+        return filename in self._files
+
+    def version(self, filename):
+        """Source mtime, used to bust cached thumbnail URLs when an avatar is replaced."""
+        return int(self._files.get(filename, 0))
+
+    def thumbnail(self, filename, fmt):
+        """Path of the `fmt` thumbnail for an avatar, generated if missing or stale."""
+        if Image is None or fmt not in THUMB_FORMATS:
+            return None
+        if filename not in self:
+            return None
+        try:
+            source_mtime = os.stat(os.path.join(self.directory, filename)).st_mtime
+        except FileNotFoundError:
+            return None
+        if source_mtime != self._files.get(filename):
+            # Overwritten since the last scan: serve the new version from now on
+            with self._lock:
+                if filename in self._files:
+                    self._files[filename] = source_mtime
+        # Full source name, extension included, so x.jpg and x.png get separate thumbnails
+        path = os.path.join(self.thumb_dir, f"{filename}.{fmt}")
+        if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+            os.makedirs(self.thumb_dir, exist_ok=True)
+            with Image.open(os.path.join(self.directory, filename)) as image:
+                image = image.convert('RGB')
+                image.thumbnail(THUMB_SIZE)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                image.save(tmp_path, THUMB_FORMATS[fmt], quality=80)
+                os.replace(tmp_path, path)  # concurrent requests never see a half-written file
+        return path
+
+    def build_all(self):
+        """Generate every thumbnail now. Returns the paths written."""
+        paths = []
+        for filename in self.filenames():
+            for fmt in THUMB_FORMATS:
+                path = self.thumbnail(filename, fmt)
+                if path:
+                    paths.append(path)
+        return paths
+
+
+avatar_registry = AvatarRegistry()
+avatars = Blueprint('avatars', __name__)
+
+
+def avatar_thumb_url(filename, fmt='jpg', version=None):
+    """Thumbnail URL for the picker, or the full-size image when thumbnails are unavailable."""
+    if Image is None:
+        return url_for('static', filename='img/avatar/' + filename)
+    if version is None:
+        version = avatar_registry.version(filename)
+    return url_for('avatars.thumbnail', fmt=fmt, filename=filename, v=version)
+
+
+@avatars.route('/avatar_thumbs/<fmt>/<filename>')
+def thumbnail(fmt, filename):
+    path = avatar_registry.thumbnail(filename, fmt)
+    if path is None:
+        abort(404)
+    # The URL carries ?v=<source mtime>, so the thumbnail can be cached for a long time
+    return send_from_directory(os.path.dirname(path), os.path.basename(path), max_age=31536000)
+
+
+def init_avatars(app):
+    app.register_blueprint(avatars)
+    app.add_template_global(avatar_thumb_url)
+    app.add_template_global(Image is not None, 'avatar_thumbs_enabled')
@@ -0,0 +1,494 @@
+import click
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from jinja2 import FileSystemBytecodeCache
+from flask_login import login_user
+from bson import ObjectId
+from mongoengine.context_managers import switch_collection
+from datetime import datetime, timedelta
+
+from app.config import CONFIG_PROFILES
+from app.models.book_doc import Book, CachedCatalogPage, SEED_VERSION, invalidate_catalog
+from app.models.book import Booking
+from app.models.job import Job
+from app.models.loan import Loan, BookSnapshot, LOAN_SCHEMA_VERSION, LOAN_PERIOD
+from app.models.migration import Migration
+from app.models.package import Package
+from app.models.users import User
+from app.passwords import hash_passwords, PASSWORD_HASH_METHOD
+from app.static_assets import build_assets
+from app.avatars import avatar_registry, THUMB_FORMATS
+from app.database import command_monitor
+
+# Every Document whose meta['indexes'] should exist in MongoDB
+INDEXED_MODELS = [Book, Booking, Job, Loan, Migration, Package, User]
+
+# The queries the models run in production, built with placeholder values so
+# explain() shows which plan MongoDB would pick for them.
+
+def model_queries():
+    some_id = ObjectId()
+    now = datetime.now()
+    return [
+        ("Book catalog (All)", Book.catalog_query('All').order_by('title', 'id')),
+        ("Book catalog (category)", Book.catalog_query('Adult').order_by('title', 'id')),
+        ("Book.get_book_by_title", Book.objects(title='')),
+        ("Book.search (text)", Book.search('magic')),
+        ("Book.search (genre)", Book.search(genre='Fiction')),
+        ("Loan.get_user_loans", Loan.objects(borrower=some_id).order_by('-borrow_date')),
+        ("Loan.get_user_loans (active)", Loan.objects(borrower=some_id, return_date=None).order_by('-borrow_date')),
+        ("Loan.get_specific_loan", Loan.objects(borrower=some_id, book=some_id, return_date=None)),
+        ("Loan.get_all_overdue_loans", Loan.objects(status='overdue').order_by('due_date')),
+        ("Loan.mark_overdue_loans", Loan.objects(status='active', due_date__lt=now)),
+        ("Booking.getUserBookingsFromDate", Booking.objects(customer=some_id, check_in_date__gte=now)),
+        ("Booking.getBooking", Booking.objects(customer=some_id, check_in_date=now, package=some_id)),
+        ("User.getUser", User.objects(email='')),
+        ("Package.getPackage", Package.objects(hotel_name='')),
+    ]
+
+
+def find_stages(plan):
+    """Yield every stage name in an explain() winning plan tree."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from find_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from find_stages(item)
+
+
+# bench-search --synthetic: generated books go to a scratch collection that is dropped afterwards
+SYNTHETIC_BOOKS_COLLECTION = 'books_bench'
+SYNTHETIC_WORDS = ('river', 'night', 'garden', 'stone', 'winter', 'letters', 'crown', 'harbour', 'silver', 'fox',
+                   'magic', 'love', 'habits', 'storm', 'island', 'mirror', 'shadow', 'empire', 'kitchen', 'orbit')
+SYNTHETIC_QUERIES = ('', 'magic', 'winter garden', 'orbit')
+SYNTHETIC_CATEGORIES = ('Adult', 'Children', 'Teens')
+SYNTHETIC_GENRES = ('Fiction', 'Fantasy', 'Romance', 'Mystery', 'Nonfiction', 'Poetry', 'Comics')
+
+
+def synthetic_books(count, chunk_size=1000, seed=0):
+    """Yield lists of up to chunk_size generated (unsaved) Books with random titles and descriptions."""
+    rng = random.Random(seed)
+    for offset in range(0, count, chunk_size):
+        chunk = []
+        for i in range(offset, min(offset + chunk_size, count)):
+            description = [' '.join(rng.choices(SYNTHETIC_WORDS, k=12)) for _ in range(rng.randrange(1, 4))]
+            chunk.append(Book(
+                title=f"{' '.join(rng.choices(SYNTHETIC_WORDS, k=3)).title()} {i}",
+                authors=[f"Author {rng.randrange(count // 5 + 1)}"],
+                category=rng.choice(SYNTHETIC_CATEGORIES),
+                genres=rng.sample(SYNTHETIC_GENRES, 2),
+                description=description,
+                short_description=Book.summarize(description),
+                url='', copies=2, available=2))
+        yield chunk
+
+
+def percentiles(timings):
+    """(p50, p95) of a list of timings."""
+    return statistics.median(timings), statistics.quantiles(timings, n=20)[-1]
+
+
+def run_search_bench(queries, runs):
+    invalidate_catalog()
+    click.echo(f"{Book.objects.count()} titles, {runs} runs per query")
+    for text in queries:
+        search, facets, uncached = [], [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            list(Book.search(text))
+            search.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            Book.search_facets(text)
+            facets.append((time.perf_counter() - start) * 1000)
+            if not text:
+                # What each visit cost before the no-text facets were cached
+                invalidate_catalog()
+                start = time.perf_counter()
+                Book.search_facets(text)
+                uncached.append((time.perf_counter() - start) * 1000)
+        (search_p50, search_p95), (facets_p50, facets_p95) = percentiles(search), percentiles(facets)
+        line = (f"{text or '(no text)'!r}: search p50 {search_p50:.1f} ms, p95 {search_p95:.1f} ms; "
+                f"facets p50 {facets_p50:.1f} ms, p95 {facets_p95:.1f} ms")
+        if uncached:
+            uncached_p50, uncached_p95 = percentiles(uncached)
+            line += f" (uncached p50 {uncached_p50:.1f} ms, p95 {uncached_p95:.1f} ms)"
+        click.echo(line)
+
+
+def ensure_indexes():
+    """Build the indexes declared in each model's meta (no-op if they exist)."""
+    for model in INDEXED_MODELS:
+        model.ensure_indexes()
+
+
+def register_commands(app):
+    """Register one-time setup/migration commands on the Flask CLI."""
+
+    @app.cli.command('seed-books')
+    @click.option('--force', is_flag=True, help='Re-run even if this seed version was already applied.')
+    def seed_books(force):
+        """Seed the books collection from all_books (run once before `flask run`)."""
+        applied = Migration.get_version('seed_books')
+        if applied >= SEED_VERSION and not force:
+            click.echo(f"Books already seeded (version {applied}). Use --force to re-run.")
+            return
+
+        inserted, matched = Book.seed_from_all_books()
+        backfilled = Book.backfill_short_descriptions()
+        Migration.set_version('seed_books', SEED_VERSION)
+        click.echo(f"Seeded books v{SEED_VERSION}: {inserted} inserted, {matched} already present, "
+                   f"{backfilled} short descriptions backfilled.")
+
+    @app.cli.command('migrate-loans')
+    def migrate_loans():
+        """Bring stored loans up to LOAN_SCHEMA_VERSION (closes duplicate unreturned loans first)."""
+        applied = Migration.get_version('loans')
+        if applied >= LOAN_SCHEMA_VERSION:
+            click.echo(f"Loans already at version {applied}.")
+            return
+
+        updated = Loan.backfill_active()
+        updated += Loan.backfill_book_snapshots()
+        updated += Loan.backfill_due_dates()
+        Migration.set_version('loans', LOAN_SCHEMA_VERSION)
+        click.echo(f"Migrated loans to v{LOAN_SCHEMA_VERSION}: {updated} updated.")
+
+    @app.cli.command('check-migrate-loans')
+    @click.pass_context
+    def check_migrate_loans(ctx):
+        """Run migrate-loans on seeded legacy loans (with duplicate open loans) in scratch collections."""
+        borrower, other, book_id = ObjectId(), ObjectId(), ObjectId()
+        borrowed = datetime(2020, 1, 1)
+        legacy = [{'borrower': borrower, 'book': book_id, 'borrow_date': borrowed + timedelta(days=day),
+                   'return_date': None, 'renew_count': 0} for day in range(3)]
+        legacy += [{'borrower': other, 'book': book_id, 'borrow_date': borrowed, 'return_date': None, 'renew_count': 0},
+                   {'borrower': other, 'book': book_id, 'borrow_date': borrowed, 'return_date': borrowed, 'renew_count': 0}]
+
+        with switch_collection(Loan, 'loans_migration_check'), switch_collection(Book, 'books_migration_check'), \
+                switch_collection(Migration, 'migrations_migration_check'):
+            collections = [Loan._get_collection(), Book._get_collection(), Migration._get_collection()]
+            try:
+                # Four open loans, each of which took one of the four copies
+                Book._get_collection().insert_one({'_id': book_id, 'title': 'Migration check', 'url': '',
+                                                   'authors': [], 'copies': 4, 'available': 0})
+                Loan._get_collection().insert_many(legacy)
+                ctx.invoke(migrate_loans)
+
+                open_loans = Loan.objects(return_date=None)
+                problems = []
+                if Migration.get_version('loans') != LOAN_SCHEMA_VERSION:
+                    problems.append("schema version was not recorded")
+                if Loan.objects(borrower=borrower, active=True).count() != 1:
+                    problems.append("duplicate open loans were not closed")
+                if Loan.objects(borrower=borrower, active=True).first().borrow_date != legacy[2]['borrow_date']:
+                    problems.append("the newest duplicate was not the one kept")
+                if open_loans.count() != 2 or open_loans.filter(active__ne=True).count():
+                    problems.append("open loans are not exactly the two kept ones")
+                if Loan.objects(__raw__={'$or': [{'active': {'$exists': False}}, {'status': {'$exists': False}}]}).count():
+                    problems.append("some loans were not backfilled")
+                available = Book.objects(id=book_id).scalar('available').first()
+                if available != 2:
+                    problems.append(f"available is {available}, expected 2 after putting back the closed loans' copies")
+            finally:
+                for collection in collections:
+                    collection.drop()
+
+        if problems:
+            raise click.ClickException('; '.join(problems))
+        click.echo("OK: duplicate open loans closed, copies put back and the migration recorded.")
+
+    @app.cli.command('sweep-overdue')
+    def sweep_overdue():
+        """Mark active loans past their due date as overdue (for cron; see OVERDUE_SWEEP_MINUTES)."""
+        click.echo(f"Marked {Loan.mark_overdue_loans()} loans overdue.")
+
+    @app.cli.command('ensure-indexes')
+    def ensure_indexes_command():
+        """Create the MongoDB indexes declared on every model."""
+        ensure_indexes()
+        for model in INDEXED_MODELS:
+            click.echo(f"{model._get_collection_name()}: {', '.join(model._get_collection().index_information())}")
+
+    @app.cli.command('explain-queries')
+    def explain_queries():
+        """Run explain() on each model query and flag any collection scan."""
+        queries = model_queries()
+        collscans = 0
+        for name, queryset in queries:
+            stages = list(find_stages(queryset.explain().get('queryPlanner', {}).get('winningPlan', {})))
+            if 'COLLSCAN' in stages:
+                collscans += 1
+                click.echo(f"COLLSCAN  {name}")
+            else:
+                click.echo(f"ok        {name}: {' <- '.join(stages)}")
+        click.echo(f"{collscans} of {len(queries)} queries scan a whole collection.")
+
+    @app.cli.command('bench-search')
+    @click.option('--runs', default=50, help='Timed runs per query.')
+    @click.option('--synthetic', default=0, help='Benchmark N generated books in a scratch collection instead.')
+    @click.argument('queries', nargs=-1)
+    def bench_search(runs, synthetic, queries):
+        """Time /search (results page + facets) against the current catalog or a synthetic one."""
+        if not synthetic:
+            run_search_bench(queries or ('', 'magic', 'love', 'habits'), runs)
+            return
+
+        # Book reads and writes go to the scratch collection inside this block
+        with switch_collection(Book, SYNTHETIC_BOOKS_COLLECTION):
+            collection = Book._get_collection()
+            collection.drop()
+            try:
+                start = time.perf_counter()
+                for chunk in synthetic_books(synthetic):
+                    collection.insert_many([book.to_mongo() for book in chunk], ordered=False)
+                seeded = time.perf_counter() - start
+                start = time.perf_counter()
+                Book.ensure_indexes()
+                click.echo(f"Seeded {synthetic} books into {SYNTHETIC_BOOKS_COLLECTION} in {seeded:.1f} s, "
+                           f"indexes built in {time.perf_counter() - start:.1f} s")
+                run_search_bench(queries or SYNTHETIC_QUERIES, runs)
+            finally:
+                collection.drop()
+                invalidate_catalog()  # facets cached for the scratch books
+
+    @app.cli.command('bench-hash')
+    @click.option('--users', default=2000, help='Passwords to hash per run.')
+    @click.option('--workers', default='1,2,4', help='Comma-separated worker counts to compare.')
+    @click.option('--method', default=None, help='Hash method (defaults to PASSWORD_HASH_METHOD).')
+    def bench_hash(users, workers, method):
+        """Report bulk-import password hashing throughput (users/sec) per worker count."""
+        passwords = [f"password-{i}" for i in range(users)]
+        click.echo(f"{users} passwords, method {method or PASSWORD_HASH_METHOD}")
+        for count in [int(w) for w in workers.split(',')]:
+            start = time.perf_counter()
+            hash_passwords(passwords, method=method, workers=count)
+            elapsed = time.perf_counter() - start
+            click.echo(f"{count} worker(s): {users / elapsed:.0f} users/sec")
+
+    @app.cli.command('bench-render')
+    @click.option('--runs', default=200, help='Timed renders per template.')
+    @click.option('--rows', default=20, help='Books/loans per page.')
+    def bench_render(runs, rows):
+        """Compare books.html and my_loans.html render times under each config profile."""
+        cards = [{'id': str(ObjectId()), 'title': f"Book {i}", 'authors': ["An Author"], 'category': 'Adult',
+                  'genres': ["Fiction", "Romance"], 'pages': 300, 'url': "", 'available': 1,
+                  'short_description': "First paragraph ... last paragraph"} for i in range(rows)]
+        loans = [SimpleNamespace(id=ObjectId(), book_snapshot=SimpleNamespace(title=f"Book {i}", url="", authors=["An Author"]),
+                                 borrow_date=datetime.now(), return_date=None, renew_count=0,
+                                 due_date=datetime.now(), status='active', is_overdue=lambda: False,
+                                 is_returned=lambda: False) for i in range(rows)]
+        pages = {
+            'books.html': lambda: {'panel': "BOOK TITLES", 'all_books': CachedCatalogPage(cards, True, "x"),
+                                   'total_titles': rows, 'after': None, 'limit': rows, 'selected_category': 'All'},
+            'my_loans.html': lambda: {'panel': "Current Loans", 'loans': loans, 'page': 1, 'has_next': False},
+        }
+
+        with tempfile.TemporaryDirectory() as bytecode_dir, app.test_request_context('/'):
+            for profile_name, profile in CONFIG_PROFILES.items():
+                # Same loader, filters and globals as the app; caching as the profile sets it up
+                env = app.jinja_env.overlay(auto_reload=profile.TEMPLATES_AUTO_RELOAD, cache_size=400)
+                if profile.JINJA_CACHE_ENABLED:
+                    env.bytecode_cache = FileSystemBytecodeCache(bytecode_dir)
+                else:
+                    env.cache = {}
+                    env.bytecode_cache = None
+
+                for template_name, make_context in pages.items():
+                    context = make_context()
+                    app.update_template_context(context)
+                    start = time.perf_counter()
+                    env.get_template(template_name).render(context)
+                    first = (time.perf_counter() - start) * 1000
+                    timings = []
+                    for _ in range(runs):
+                        start = time.perf_counter()
+                        env.get_template(template_name).render(context)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    click.echo(f"{profile_name:12} {template_name:14} first {first:6.2f} ms, "
+                               f"mean {statistics.mean(timings):6.3f} ms")
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Fingerprint and precompress static files into instance/assets."""
+        built = build_assets(app.static_folder)
+        click.echo(f"Built {len(built)} fingerprinted assets.")
+
+    @app.cli.command('build-avatars')
+    def build_avatars():
+        """Generate avatar picker thumbnails (otherwise made on first request)."""
+        click.echo(f"Built {len(avatar_registry.build_all())} avatar thumbnails.")
+
+    @app.cli.command('bench-avatars')
+    def bench_avatars():
+        """Compare /changeAvatar image weight: full-size files vs JPEG and WebP thumbnails."""
+        filenames = avatar_registry.filenames()
+        full = sum(os.path.getsize(os.path.join(avatar_registry.directory, f)) for f in filenames)
+        click.echo(f"{len(filenames)} avatars, full size: {full / 1024:.1f} KiB")
+        for fmt in THUMB_FORMATS:
+            paths = [avatar_registry.thumbnail(f, fmt) for f in filenames]
+            if None in paths:
+                click.echo("Thumbnails unavailable (Pillow is not installed).")
+                return
+            thumbs = sum(os.path.getsize(p) for p in paths)
+            click.echo(f"{fmt} thumbnails: {thumbs / 1024:.1f} KiB ({100 * thumbs / full:.0f}% of full size)")
+
+    @app.cli.command('bench-bookings')
+    @click.option('--count', default=200, help='Bookings to create per method.')
+    def bench_bookings(count):
+        """Compare MongoDB round trips and time per booking: the old two-save flow, createBooking and create_many."""
+        customer = User.objects.first()
+        package = Package.objects.first()
+        if customer is None or package is None:
+            raise click.ClickException("Needs at least one user and one package (upload them first).")
+        check_in = datetime(2000, 1, 1)
+
+        def two_save_booking():
+            # What booking used to cost: package lookup, insert, then save total_cost separately
+            booking = Booking(check_in_date=check_in, customer=customer,
+                              package=Package.getPackage(package.hotel_name)).save()
+            booking.total_cost = booking.package.duration * booking.package.unit_cost
+            return booking.save()
+
+        methods = [
+            ('two saves (old)', lambda: [two_save_booking() for _ in range(count)]),
+            ('createBooking', lambda: [Booking.createBooking(check_in, customer, package) for _ in range(count)]),
+            ('create_many', lambda: Booking.create_many([(check_in, customer, package)] * count)),
+        ]
+        created = []
+        try:
+            for name, create in methods:
+                commands = command_monitor.start_recording()
+                start = time.perf_counter()
+                created += create()
+                elapsed = time.perf_counter() - start
+                command_monitor.stop_recording()
+                click.echo(f"{name}: {len(commands) / count:.2f} round trips/booking, "
+                           f"{elapsed * 1000 / count:.2f} ms/booking")
+        finally:
+            Booking.objects(id__in=[booking.id for booking in created]).delete()
+
+    @app.cli.command('stress-borrow')
+    @click.option('--threads', default=16, help='Threads borrowing and returning at once.')
+    @click.option('--rounds', default=200, help='Borrow/return attempts per thread.')
+    @click.option('--copies', default=3, help='Copies of the scratch title.')
+    def stress_borrow(threads, rounds, copies):
+        """Hammer borrow_book/return_book on one scratch title and check `available` stays consistent."""
+        book = Book(title=f"Stress test {ObjectId()}", category='Test', description=['Scratch title.'],
+                    copies=copies, available=copies).save()
+        lock = threading.Lock()
+        state = {'active': 0, 'borrowed': 0, 'returned': 0, 'min_available': copies}
+        errors = []
+        done = threading.Event()
+
+        def observe(available):
+            with lock:
+                state['min_available'] = min(state['min_available'], available)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            held = 0  # copies this thread has borrowed and not returned
+            copy = Book.objects(id=book.id).only('title', 'available', 'copies').first()
+            for _ in range(rounds):
+                if held and rng.random() < 0.5:
+                    success, message = copy.return_book()
+                    if not success:
+                        errors.append(message)  # this thread holds a copy, so a return can't be refused
+                        continue
+                    held -= 1
+                    with lock:
+                        state['active'] -= 1
+                        state['returned'] += 1
+                else:
+                    success, _ = copy.borrow_book()
+                    if success:
+                        held += 1
+                        with lock:
+                            state['active'] += 1
+                            state['borrowed'] += 1
+                observe(copy.available)
+
+        def watcher():
+            # Reads the stored count between the workers' updates
+            while not done.is_set():
+                observe(Book.objects(id=book.id).scalar('available').first())
+
+        try:
+            watch = threading.Thread(target=watcher, daemon=True)
+            watch.start()
+            workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+            start = time.perf_counter()
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            done.set()
+            watch.join()
+            final = Book.objects(id=book.id).scalar('available').first()
+        finally:
+            book.delete()
+
+        click.echo(f"{threads} threads x {rounds} rounds in {elapsed:.2f} s: {state['borrowed']} borrows, "
+                   f"{state['returned']} returns, {state['active']} still out")
+        click.echo(f"available: min {state['min_available']}, final {final} (copies {copies})")
+        if errors:
+            raise click.ClickException(f"{len(errors)} returns of a held copy were refused, e.g. {errors[0]}")
+        if state['min_available'] < 0:
+            raise click.ClickException(f"available dropped to {state['min_available']}")
+        if final != copies - state['active']:
+            raise click.ClickException(f"available ended at {final}, expected {copies} - {state['active']} active loans")
+        click.echo("OK: available never went below 0 and matches copies minus active loans.")
+
+    @app.cli.command('check-loan-queries')
+    @click.option('--sizes', default='1,5,20,60', help='Comma-separated loan counts to render /my_loans with.')
+    def check_loan_queries(sizes):
+        """Check /my_loans sends the same MongoDB commands whatever the loan count, with no per-row book finds."""
+        sizes = sorted(int(size) for size in sizes.split(','))
+        user = User(email=f"q{ObjectId()}"[:30], password='-', name='Query check').save()
+        books = Book.objects.insert([
+            Book(title=f"Query check {ObjectId()}", category='Test', description=['Scratch title.'],
+                 url='', authors=['Nobody'], copies=1, available=1)
+            for _ in range(sizes[-1])], load_bulk=True)
+        book_finds = f"find {Book._get_collection_name()} "
+        counts = {}
+        try:
+            for size in sizes:
+                Loan.objects(borrower=user).delete()
+                now = datetime.now()
+                Loan.objects.insert([
+                    Loan(borrower=user, book=book, borrow_date=now, due_date=now + LOAN_PERIOD,
+                         book_snapshot=BookSnapshot.of(book))
+                    for book in books[:size]], load_bulk=False)
+
+                with app.test_request_context('/my_loans'):
+                    login_user(user)
+                    commands = command_monitor.start_recording()
+                    try:
+                        app.view_functions['loanController.my_loans']()
+                    finally:
+                        command_monitor.stop_recording()
+                shapes = [shape for _, shape, _, _ in commands]
+                counts[size] = len(shapes)
+                click.echo(f"{size} loans: {len(shapes)} commands")
+                for shape in sorted(set(shapes)):
+                    click.echo(f"    {shapes.count(shape)} x {shape}")
+                if any(shape.startswith(book_finds) for shape in shapes):
+                    raise click.ClickException(f"/my_loans looked up books per row with {size} loans")
+        finally:
+            Loan.objects(borrower=user).delete()
+            Book.objects(id__in=[book.id for book in books]).delete()
+            user.delete()
+
+        if not any(counts.values()):
+            raise click.ClickException("No MongoDB commands were recorded; is command_monitor attached to the client?")
+        if len(set(counts.values())) > 1:
+            raise click.ClickException(f"Command count grows with the loan count: {counts}")
+        click.echo(f"OK: {counts[sizes[0]]} commands per page at every size, no per-row book finds.")
@@ -0,0 +1,96 @@
+import os
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+class Config:
+    """Settings shared by every profile."""
+    MONGODB_SETTINGS = {
+        'db': 'q2b_library',  # ← Q2B database
+        'host': os.environ.get('MONGODB_HOST', 'localhost'),
+        # Pool sized for gunicorn threads; a request that can't get a
+        # connection within waitQueueTimeoutMS fails instead of hanging
+        'maxPoolSize': env_int('MONGODB_MAX_POOL_SIZE', 50),
+        'minPoolSize': env_int('MONGODB_MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS': env_int('MONGODB_MAX_IDLE_TIME_MS', 60000),
+        'waitQueueTimeoutMS': env_int('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 2000),
+        # Give up quickly when the server is unreachable
+        'serverSelectionTimeoutMS': env_int('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'connectTimeoutMS': env_int('MONGODB_CONNECT_TIMEOUT_MS', 5000),
+        'socketTimeoutMS': env_int('MONGODB_SOCKET_TIMEOUT_MS', 30000),
+        'retryWrites': env_bool('MONGODB_RETRY_WRITES', True),
+        'retryReads': env_bool('MONGODB_RETRY_READS', True),
+    }
+    # Wire compression in order of preference; ones whose library isn't
+    # installed are skipped (see configure_mongo)
+    MONGODB_COMPRESSORS = os.environ.get('MONGODB_COMPRESSORS', 'zstd,snappy,zlib').split(',')
+    # Read preference for catalog/search/trend queries, which can be slightly stale
+    MONGODB_READ_ONLY_PREFERENCE = os.environ.get('MONGODB_READ_ONLY_PREFERENCE', 'primary')
+    SECRET_KEY = os.environ.get('SECRET_KEY', '9OLWxND4o83j4K4iuopO')
+
+    # Logging (see logging_setup.py): 'json' or 'text' lines on stdout; only
+    # 1 in LOG_DEBUG_SAMPLE_EVERY DEBUG records per call site is kept
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_DEBUG_SAMPLE_EVERY = env_int('LOG_DEBUG_SAMPLE_EVERY', 100)
+
+    # Per-request timing (see instrumentation.py); requests slower than
+    # SLOW_REQUEST_MS are logged with their query shapes
+    INSTRUMENTATION_ENABLED = env_bool('INSTRUMENTATION_ENABLED', True)
+    SLOW_REQUEST_MS = env_int('SLOW_REQUEST_MS', 500)
+
+    # How often the web process marks loans past their due_date as overdue
+    # (0 turns it off, e.g. when cron runs `flask sweep-overdue` instead)
+    OVERDUE_SWEEP_MINUTES = env_int('OVERDUE_SWEEP_MINUTES', 60)
+
+    # Jinja2 template caching (see create_app)
+    JINJA_CACHE_ENABLED = True
+    JINJA_BYTECODE_CACHE_DIR = None
+    PRECOMPILE_TEMPLATES = False
+
+
+class DevelopmentConfig(Config):
+    # AGGRESSIVE CACHE DISABLING: templates and static files are re-read on every request
+    DEBUG = True
+    TEMPLATES_AUTO_RELOAD = True
+    EXPLAIN_TEMPLATE_LOADING = True
+    SEND_FILE_MAX_AGE_DEFAULT = 0
+    JINJA_CACHE_ENABLED = False
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+    LOG_DEBUG_SAMPLE_EVERY = env_int('LOG_DEBUG_SAMPLE_EVERY', 1)
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    TEMPLATES_AUTO_RELOAD = False
+    EXPLAIN_TEMPLATE_LOADING = False
+    SEND_FILE_MAX_AGE_DEFAULT = 7 * 24 * 3600
+    # Compiled templates survive restarts and are shared by worker processes
+    JINJA_BYTECODE_CACHE_DIR = os.environ.get(
+        'JINJA_BYTECODE_CACHE_DIR', os.path.join(APP_DIR, 'instance', 'jinja_cache'))
+    PRECOMPILE_TEMPLATES = True
+    # Read-only pages may be served by a secondary (the primary when there is none)
+    MONGODB_READ_ONLY_PREFERENCE = os.environ.get('MONGODB_READ_ONLY_PREFERENCE', 'secondaryPreferred')
+
+
+CONFIG_PROFILES = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
+
+
+def get_config(name=None):
+    """Profile named by APP_CONFIG (development by default)."""
+    name = name or os.environ.get('APP_CONFIG', 'development')
+    if name not in CONFIG_PROFILES:
+        raise ValueError(f"APP_CONFIG must be one of {', '.join(CONFIG_PROFILES)}, not {name!r}")
+    return CONFIG_PROFILES[name]
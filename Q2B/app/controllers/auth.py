@@ -1,13 +1,29 @@
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from flask_login import login_user, login_required, logout_user, current_user
-from flask import Blueprint, request, redirect, render_template, url_for, flash
+from flask import Blueprint, request, redirect, render_template, url_for, flash, session, g, jsonify
 from app import login_manager
+import logging
+import time
 
 from app.models.forms import RegForm
-from app.models.users import User
+from app.models.users import User, user_cache
+from app.passwords import hash_password
 import os
 
 auth = Blueprint('auth', __name__)
+logger = logging.getLogger(__name__)
+
+# A snapshot of the logged-in user rides along in the (signed) session, so
+# most requests build current_user without touching the cache or MongoDB.
+SESSION_SNAPSHOT_TTL = 900  # seconds before the snapshot is refreshed from the DB
+user_load_counts = {'session': 0, 'cache': 0, 'db': 0}
+
+
+def remember_user(user):
+    """Store (or refresh) the session snapshot of the logged-in user."""
+    snapshot = user.to_snapshot()
+    snapshot['saved_at'] = time.time()
+    session['user_snapshot'] = snapshot
 
 @auth.route('/register', methods=['GET', 'POST'])
 def register():
@@ -16,7 +32,7 @@ def register():
         if form.validate():
             existing_user = User.getUser(email=form.email.data)
             if not existing_user:
-                hashpass = generate_password_hash(form.password.data, method='sha256')
+                hashpass = hash_password(form.password.data)
                 User.createUser(email=form.email.data,password=hashpass, name=form.name.data)
                 return redirect(url_for('auth.login'))
             else:
@@ -28,12 +44,13 @@ def register():
 def login():
     form = RegForm()
     if request.method == 'POST':
-        print(request.form.get('checkbox'))
+        logger.debug('Login attempt', extra={'remember': request.form.get('checkbox')})
         if form.validate():
             check_user = User.getUser(email=form.email.data)
             if check_user:
                 if check_password_hash(check_user['password'], form.password.data):
                     login_user(check_user)
+                    remember_user(check_user)
                     return redirect(url_for('packageController.book_titles'))      
                 else:
                     form.password.errors.append("User Password Not Correct")
@@ -45,13 +62,53 @@ def login():
 @login_required
 def logout():
     logout_user()
+    session.pop('user_snapshot', None)
     return redirect(url_for('packageController.book_titles'))
 
-# Load the current user if any
+# Load the current user if any: session snapshot, then user_cache, then MongoDB
 @login_manager.user_loader
 def load_user(user_id):
-    print('loading user_id: ', user_id)
-    return User.getUserById(user_id)
+    snapshot = session.get('user_snapshot')
+    if snapshot and snapshot.get('id') == user_id and time.time() - snapshot.get('saved_at', 0) < SESSION_SNAPSHOT_TTL:
+        return loaded_from('session', User.from_snapshot(snapshot))
+
+    cached = user_cache.get(user_id)
+    if cached:
+        user = loaded_from('cache', User.from_snapshot(cached))
+    else:
+        user = User.getUserById(user_id)
+        if user is None:
+            return None
+        user_cache.set(user_id, user.to_snapshot())
+        loaded_from('db', user)
+    remember_user(user)
+    return user
+
+
+def loaded_from(source, user):
+    # g.user_load_source is reported per request in the X-User-Source header
+    g.user_load_source = source
+    logger.debug('Loaded current user', extra={'source': source})
+    user_load_counts[source] += 1
+    return user
+
+
+@auth.after_app_request
+def report_user_source(response):
+    source = g.get('user_load_source')
+    if source:
+        response.headers['X-User-Source'] = source
+    return response
+
+
+@auth.route('/user_cache_stats')
+@login_required
+def user_cache_stats():
+    # How often current_user came from the session, the cache or MongoDB (admin only)
+    if current_user.email != 'admin@lib.sg':
+        flash('Access denied. Admin only.', 'danger')
+        return redirect(url_for('packageController.book_titles'))
+    return jsonify(loads=user_load_counts, cache=user_cache.stats())
 
 
 
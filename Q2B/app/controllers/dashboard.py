@@ -1,8 +1,9 @@
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, url_for
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta, date
 from app import db
-from app.models.book import Booking
+from app.models.book import TREND_GRANULARITIES
+from app.jobs import submit_trend
 
 dashboard = Blueprint('dashboard', __name__)
 
@@ -17,30 +18,28 @@ def trend_chart():
     elif request.method == 'POST':
         
         #Chart is indexed by first date and last date
-        #And we are going to plot the period from 2021-01-17 to 2021-01-23
-
-        #Trend is reconstructed each time from Booking to incorporate new booking since the last trend chart
-
-        all_bookings = Booking.getAllBookings()
-        print(f"There are {len(all_bookings)} of booking records")
-        #TREND.objects.delete()
-
-        # hotel_costbyDate[hotel_name] = {date: accum_cost, ...}
-        hotel_costbyDate = {}
-
-        for aBooking in list(all_bookings):
-            hotel_name = aBooking.package.hotel_name
-            check_in_date = aBooking.check_in_date
-                      
-            if hotel_name not in hotel_costbyDate:
-                hotel_costbyDate[hotel_name] = {}
-            if check_in_date not in hotel_costbyDate[hotel_name]:
-                hotel_costbyDate[hotel_name][check_in_date] = 0
-            hotel_costbyDate[hotel_name][check_in_date] += aBooking.total_cost
-        
-        hotel_costbyDateSortedListValues = {}
-        for hotel, dateAmts in hotel_costbyDate.items():
-            hotel_costbyDateSortedListValues[hotel] = sorted(list(dateAmts.items()))
+        #Optional from/to (YYYY-MM-DD) narrow the period; granularity is day, week or month
+
+        #Trend is aggregated in MongoDB each time from Booking to incorporate new booking since the last trend chart
+        try:
+            from_date = parse_date(request.values.get('from'))
+            to_date = parse_date(request.values.get('to'))
+        except ValueError:
+            return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+
+        granularity = request.values.get('granularity', 'day')
+        if granularity not in TREND_GRANULARITIES:
+            return jsonify({'error': f"granularity must be one of {', '.join(TREND_GRANULARITIES)}"}), 400
+
+        # Aggregation runs as a background job; trend_chart.js polls /jobs/<id> for the result
+        owner = current_user.id if current_user.is_authenticated else None
+        job = submit_trend(from_date, to_date, granularity, owner=owner)
+
+        return jsonify({'job_id': str(job.id),
+                        'status_url': url_for('jobController.status', job_id=job.id)}), 202
 
-        return jsonify({'chartDim': hotel_costbyDateSortedListValues, 'labels': []})    
 
+def parse_date(value):
+    if not value:
+        return None
+    return datetime.strptime(value, "%Y-%m-%d")
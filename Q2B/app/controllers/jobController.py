@@ -0,0 +1,51 @@
+from flask import Blueprint, jsonify, url_for
+from flask_login import current_user
+
+from app.jobs import submit_retry
+from app.models.job import Job
+
+job_bp = Blueprint('jobController', __name__)
+
+
+def current_owner():
+    return current_user.id if current_user.is_authenticated else None
+
+
+def job_status(job, code=200):
+    status = job.to_status()
+    status['status_url'] = url_for('jobController.status', job_id=job.id)
+    return jsonify(status), code
+
+
+# ============================================================
+# JOB STATUS (polled by upload.html and trend_chart.js)
+# ============================================================
+
+@job_bp.route('/jobs/<job_id>')
+def status(job_id):
+    job = Job.get_job(job_id, owner=current_owner())
+    if not job:
+        return jsonify(error='Job not found.'), 404
+    return job_status(job)
+
+
+@job_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel(job_id):
+    job = Job.get_job(job_id, owner=current_owner())
+    if not job:
+        return jsonify(error='Job not found.'), 404
+    if not job.request_cancel():
+        return jsonify(error=f'Job already {job.status}.'), 409
+    job.reload()
+    return job_status(job)
+
+
+@job_bp.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry(job_id):
+    """Re-run only the rows that failed in a finished import."""
+    job = Job.get_job(job_id, owner=current_owner())
+    if not job:
+        return jsonify(error='Job not found.'), 404
+    if job.kind != 'import' or not job.is_finished() or not job.failed:
+        return jsonify(error='Only finished imports with failed rows can be retried.'), 409
+    return job_status(submit_retry(job, owner=current_owner()), 202)
@@ -1,9 +1,10 @@
-from flask import Blueprint, request, redirect, render_template, url_for, flash
+from flask import Blueprint, request, redirect, render_template, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, timedelta
 import random
 
-from app.models.loan import Loan
+from app.models.loan import (Loan, LOANS_PER_PAGE, BULK_ACTIONS, MAX_BULK_LOANS, RENEW_FIELDS, RETURN_FIELDS,
+                             DELETE_FIELDS)
 from app.models.book_doc import Book
 from app.models.users import User
 
@@ -56,12 +57,12 @@ def make_loan(book_title):
 @login_required
 def my_loans():
     """
-    Display all loans for the current user.
+    Display the current user's loans, one page at a time (active loans first).
     """
-    # Get all loans for current user
-    all_loans = Loan.get_user_loans(current_user._get_current_object(), include_returned=True)
+    page = max(1, request.args.get('page', 1, type=int))
+    loans, has_next = Loan.get_user_loans_page(current_user._get_current_object(), page=page, limit=LOANS_PER_PAGE)
     
-    return render_template('my_loans.html', panel="Current Loans", loans=all_loans)
+    return render_template('my_loans.html', panel="Current Loans", loans=loans, page=page, has_next=has_next)
 
 
 # ============================================================
@@ -74,17 +75,13 @@ def renew_loan(loan_id):
     """
     Renew a loan for the current user.
     """
-    loan = Loan.get_loan_by_id(loan_id)
+    # Ownership is checked by the query itself (someone else's loan is "not found")
+    loan = Loan.get_user_loan(loan_id, current_user.id, RENEW_FIELDS)
     
     if not loan:
         flash('Loan not found.', 'danger')
         return redirect(url_for('loanController.my_loans'))
     
-    # Verify loan belongs to current user
-    if loan.borrower.id != current_user.id:
-        flash('You can only renew your own loans.', 'danger')
-        return redirect(url_for('loanController.my_loans'))
-    
     success, message = loan.renew_loan()
     
     if success:
@@ -105,17 +102,13 @@ def return_loan(loan_id):
     """
     Return a borrowed book.
     """
-    loan = Loan.get_loan_by_id(loan_id)
+    # Ownership is checked by the query itself (someone else's loan is "not found")
+    loan = Loan.get_user_loan(loan_id, current_user.id, RETURN_FIELDS)
     
     if not loan:
         flash('Loan not found.', 'danger')
         return redirect(url_for('loanController.my_loans'))
     
-    # Verify loan belongs to current user
-    if loan.borrower.id != current_user.id:
-        flash('You can only return your own loans.', 'danger')
-        return redirect(url_for('loanController.my_loans'))
-    
     success, message = loan.return_loan()
     
     if success:
@@ -126,6 +119,31 @@ def return_loan(loan_id):
     return redirect(url_for('loanController.my_loans'))
 
 
+# ============================================================
+# BULK RENEW / RETURN (JSON)
+# ============================================================
+
+@loan_bp.route('/loans/bulk', methods=['POST'])
+@login_required
+def bulk_loans():
+    """
+    Renew or return many of the current user's loans at once.
+    Body: {"action": "renew" | "return", "loan_ids": [...]}
+    """
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    loan_ids = data.get('loan_ids')
+    if action not in BULK_ACTIONS:
+        return jsonify(error=f"action must be one of: {', '.join(BULK_ACTIONS)}."), 400
+    if not isinstance(loan_ids, list) or not all(isinstance(loan_id, str) for loan_id in loan_ids):
+        return jsonify(error="loan_ids must be a list of loan ids."), 400
+    if len(loan_ids) > MAX_BULK_LOANS:
+        return jsonify(error=f"At most {MAX_BULK_LOANS} loans per request."), 400
+
+    results = Loan.bulk_update(current_user.id, loan_ids, action)
+    return jsonify(action=action, results=results, succeeded=sum(1 for item in results if item['ok']))
+
+
 # ============================================================
 # DELETE LOAN
 # ============================================================
@@ -136,17 +154,13 @@ def delete_loan(loan_id):
     """
     Delete a returned loan record.
     """
-    loan = Loan.get_loan_by_id(loan_id)
+    # Ownership is checked by the query itself (someone else's loan is "not found")
+    loan = Loan.get_user_loan(loan_id, current_user.id, DELETE_FIELDS)
     
     if not loan:
         flash('Loan not found.', 'danger')
         return redirect(url_for('loanController.my_loans'))
     
-    # Verify loan belongs to current user
-    if loan.borrower.id != current_user.id:
-        flash('You can only delete your own loans.', 'danger')
-        return redirect(url_for('loanController.my_loans'))
-    
     success, message = loan.delete_loan()
     
     if success:
@@ -1,5 +1,5 @@
 from flask_login import login_user, login_required, logout_user, current_user
-from flask import Blueprint, request, redirect, render_template, url_for, flash
+from flask import Blueprint, request, redirect, render_template, url_for, flash, jsonify
 
 from app.models.forms import BookForm, AddBookForm
 from app.models.books import all_books
@@ -7,7 +7,7 @@ from app.models.users import User
 from app.models.package import Package
 
 #mongoDB
-from app.models.book_doc import Book
+from app.models.book_doc import Book, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, catalog_cache
 
 package = Blueprint('packageController', __name__)
 
@@ -19,25 +19,60 @@ package = Blueprint('packageController', __name__)
 #     return render_template('books.html', panel="BOOK TITLES", all_books=all_books)
 
 def book_titles():
-    # Seed MongoDB if empty (first time only)
-    Book.seed_from_all_books_if_empty()
-    
+    # Catalog is seeded once by `flask seed-books`, not per request
     selected_category = request.args.get('category', 'All')
+    after = request.args.get('after')
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
 
-    # Query MongoDB instead of all_books list
-    if selected_category == 'All':
-        books_query = Book.objects()
-    else:
-        books_query = Book.objects(category=selected_category)
-    
-    # Sort alphabetically by title using MongoDB
-    sorted_books = books_query.order_by('title')
+    # One page of books sorted by title (cached; see book_doc.catalog_cache)
+    page = Book.get_cached_catalog_page(category=selected_category, after=after, limit=limit)
+    total_titles = Book.count_cached_titles(selected_category)
 
     return render_template('books.html', panel="BOOK TITLES", 
-                         all_books=sorted_books, 
+                         all_books=page,
+                         total_titles=total_titles,
+                         after=after,
+                         limit=limit,
                          selected_category=selected_category)
     
 
+@package.route('/search')
+def search():
+    text = request.args.get('q', '').strip()
+    selected_category = request.args.get('category', 'All')
+    genre = request.args.get('genre') or None
+    author = request.args.get('author') or None
+    page = max(1, request.args.get('page', 1, type=int))
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    results = [book.to_card() for book in
+               Book.search(text, selected_category, genre, author, page=page, limit=limit)]
+    facets = Book.search_facets(text, selected_category, genre, author)
+
+    return render_template('search.html', panel="SEARCH",
+                         results=results,
+                         facets=facets,
+                         q=text,
+                         selected_category=selected_category,
+                         genre=genre,
+                         author=author,
+                         page=page,
+                         limit=limit,
+                         has_next=page * limit < facets['total'])
+
+
+@package.route('/catalog_cache_stats')
+@login_required
+def catalog_cache_stats():
+    # Hit/miss/eviction counters for sizing the catalog cache (admin only)
+    if current_user.email != 'admin@lib.sg':
+        flash('Access denied. Admin only.', 'danger')
+        return redirect(url_for('packageController.book_titles'))
+    return jsonify(catalog_cache.stats())
+
+
 @package.route("/viewBookDetail/<book_title>")
 def viewBookDetail(book_title):
     # Query MongoDB for the book
@@ -0,0 +1,217 @@
+# MongoDB client options and monitoring. configure_mongo() runs in create_app
+# before MongoEngine connects: it drops compressors whose library isn't
+# installed, attaches pool_monitor and command_monitor to the client and picks
+# the read preference used by read-only queries (catalog, search, trends).
+from flask import Blueprint, jsonify, flash, redirect, url_for
+from flask_login import login_required, current_user
+from pymongo import ReadPreference, monitoring
+import json
+import threading
+import time
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+# Python module each wire compressor needs (zlib ships with Python)
+COMPRESSOR_MODULES = {'zstd': 'zstandard', 'snappy': 'snappy', 'zlib': 'zlib'}
+
+database = Blueprint('database', __name__)
+read_only_preference = ReadPreference.PRIMARY
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Counts connection checkouts and how long requests waited for one."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counts = {
+            'checked_out': 0, 'max_checked_out': 0, 'checkouts': 0,
+            'checkout_failures': 0, 'connections_created': 0, 'connections_closed': 0,
+            'pools_cleared': 0,
+        }
+        self.failure_reasons = {}
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _add(self, key, n=1):
+        with self._lock:
+            self.counts[key] += n
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counts)
+            stats['failure_reasons'] = dict(self.failure_reasons)
+            stats['wait_avg_ms'] = round(self.wait_total * 1000 / stats['checkouts'], 3) if stats['checkouts'] else 0.0
+            stats['wait_max_ms'] = round(self.wait_max * 1000, 3)
+        return stats
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        waited = time.perf_counter() - getattr(self._local, 'started', time.perf_counter())
+        with self._lock:
+            self.counts['checkouts'] += 1
+            self.counts['checked_out'] += 1
+            self.counts['max_checked_out'] = max(self.counts['max_checked_out'], self.counts['checked_out'])
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def connection_check_out_failed(self, event):
+        # 'timeout' here means the pool was exhausted for waitQueueTimeoutMS
+        with self._lock:
+            self.counts['checkout_failures'] += 1
+            self.failure_reasons[event.reason] = self.failure_reasons.get(event.reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        self._add('checked_out', -1)
+
+    def connection_created(self, event):
+        self._add('connections_created')
+
+    def connection_closed(self, event):
+        self._add('connections_closed')
+
+    def pool_cleared(self, event):
+        self._add('pools_cleared')
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+pool_monitor = PoolMonitor()
+
+
+def query_shape(value):
+    """The structure of a filter/pipeline with every literal replaced by '?'."""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            shape = query_shape(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return '?'
+
+
+def command_shape(name, command):
+    """e.g. 'find books {"category": "?"}' -- what a command did, without its values."""
+    collection = command.get(name)
+    if name in ('find', 'count', 'delete', 'findAndModify', 'distinct'):
+        spec = command.get('filter', command.get('query', command.get('deletes')))
+    elif name == 'aggregate':
+        return f"{name} {collection} {' '.join(next(iter(stage)) for stage in command.get('pipeline', []))}"
+    elif name == 'update':
+        spec = [update.get('q') for update in command.get('updates', [])]
+    elif name == 'insert':
+        spec = f"{len(command.get('documents', []))} docs"
+        return f'{name} {collection} {spec}'
+    else:
+        spec = None
+    if spec is None:
+        return f'{name} {collection}'
+    return f'{name} {collection} {json.dumps(query_shape(spec), default=str)}'
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """
+    Records the shape and duration of every command the current thread sends
+    while recording (see instrumentation.py); other threads are ignored.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def start_recording(self):
+        self._local.commands = []
+        self._local.pending = {}
+        return self._local.commands
+
+    def stop_recording(self):
+        self._local.commands = None
+        self._local.pending = None
+
+    def started(self, event):
+        pending = getattr(self._local, 'pending', None)
+        if pending is not None:
+            pending[event.request_id] = (event.command_name, command_shape(event.command_name, event.command))
+
+    def _finish(self, event, ok):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None or event.request_id not in pending:
+            return
+        name, shape = pending.pop(event.request_id)
+        self._local.commands.append((name, shape, event.duration_micros / 1e6, ok))
+
+    def succeeded(self, event):
+        self._finish(event, True)
+
+    def failed(self, event):
+        self._finish(event, False)
+
+
+command_monitor = CommandMonitor()
+
+
+def available_compressors(names):
+    available = []
+    for name in names:
+        try:
+            __import__(COMPRESSOR_MODULES[name])
+        except (KeyError, ImportError):
+            continue
+        available.append(name)
+    return available
+
+
+def configure_mongo(app):
+    global read_only_preference
+    settings = dict(app.config['MONGODB_SETTINGS'])
+    compressors = available_compressors(app.config['MONGODB_COMPRESSORS'])
+    if compressors:
+        settings['compressors'] = ','.join(compressors)
+    settings['event_listeners'] = list(settings.get('event_listeners', [])) + [pool_monitor, command_monitor]
+    app.config['MONGODB_SETTINGS'] = settings
+
+    name = app.config['MONGODB_READ_ONLY_PREFERENCE']
+    if name not in READ_PREFERENCES:
+        raise ValueError(f"MONGODB_READ_ONLY_PREFERENCE must be one of {', '.join(READ_PREFERENCES)}, not {name!r}")
+    read_only_preference = READ_PREFERENCES[name]
+    app.register_blueprint(database)
+
+
+def read_only(queryset):
+    """Route a query that can tolerate slightly stale data to read_only_preference."""
+    return queryset.read_preference(read_only_preference)
+
+
+def read_only_collection(document):
+    """The document's pymongo collection with read_only_preference (for aggregations)."""
+    return document._get_collection().with_options(read_preference=read_only_preference)
+
+
+@database.route('/db_pool_stats')
+@login_required
+def db_pool_stats():
+    # Connection pool usage for sizing MONGODB_MAX_POOL_SIZE (admin only)
+    if current_user.email != 'admin@lib.sg':
+        flash('Access denied. Admin only.', 'danger')
+        return redirect(url_for('packageController.book_titles'))
+    return jsonify(pool_monitor.stats())
@@ -0,0 +1,174 @@
+import csv
+import datetime as dt
+import io
+from itertools import islice
+
+from mongoengine import ValidationError
+from pymongo.errors import BulkWriteError
+
+from app.models.book import Booking
+from app.models.package import Package
+from app.models.users import User
+from app.passwords import hash_passwords
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+MAX_RETRY_ROWS = 10000
+
+
+class ImportResult:
+    """
+    Counts for one CSV import plus the first MAX_REPORTED_ERRORS row errors
+    and the first MAX_RETRY_ROWS failed rows (for "retry failed rows").
+    """
+
+    def __init__(self, datatype):
+        self.datatype = datatype
+        self.processed = 0
+        self.inserted = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = []  # (csv line, message)
+        self.failed_rows = []  # (csv line, row dict)
+
+    def error(self, line, message, row=None):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+        if row is not None and len(self.failed_rows) < MAX_RETRY_ROWS:
+            self.failed_rows.append((line, row))
+
+
+def read_csv_rows(stream, encoding='utf-8'):
+    """Yield (line number, row dict) from a binary upload stream, decoding as it goes."""
+    text = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    reader = csv.DictReader(text, delimiter=',', quotechar='"')
+    for row in reader:
+        yield reader.line_num, row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_chunk(model, docs, result):
+    """
+    insert_many one chunk of (line, row, document) triples, unordered, so a
+    bad row is reported without aborting the rest of the chunk.
+    """
+    valid = []
+    for line, row, doc in docs:
+        try:
+            doc.validate()
+            valid.append((line, row, doc))
+        except ValidationError as e:
+            result.error(line, str(e), row)
+    if not valid:
+        return
+    try:
+        model._get_collection().insert_many([doc.to_mongo() for _, _, doc in valid], ordered=False)
+        result.inserted += len(valid)
+    except BulkWriteError as e:
+        failed = {err['index']: err['errmsg'] for err in e.details.get('writeErrors', [])}
+        result.inserted += len(valid) - len(failed)
+        for index, message in failed.items():
+            line, row, _ = valid[index]
+            result.error(line, message, row)
+
+
+def import_users(rows, result):
+    # One $in query for the whole chunk instead of User.getUser per row
+    emails = {row.get('email') for _, row in rows}
+    existing = set(User.objects(email__in=list(emails)).scalar('email'))
+    new_rows = []
+    for line, row in rows:
+        email = row.get('email')
+        if not email or not row.get('password'):
+            result.error(line, "email and password are required", row)
+        elif email in existing:
+            result.skipped += 1
+        else:
+            existing.add(email)  # repeated emails later in the file are skipped too
+            new_rows.append((line, row))
+
+    # Hash the whole chunk across worker processes
+    hashes = hash_passwords([row['password'] for _, row in new_rows])
+    docs = [(line, row, User(email=row['email'], password=pwd, name=row.get('name'), avatar=""))
+            for (line, row), pwd in zip(new_rows, hashes)]
+    insert_chunk(User, docs, result)
+
+
+def import_packages(rows, result):
+    docs = []
+    for line, row in rows:
+        try:
+            docs.append((line, row, Package(hotel_name=row['hotel_name'], duration=int(row['duration']),
+                                            unit_cost=float(row['unit_cost']), image_url=row['image_url'],
+                                            description=row['description'])))
+        except (KeyError, ValueError) as e:
+            result.error(line, f"bad package row: {e}", row)
+    insert_chunk(Package, docs, result)
+
+
+def import_bookings(rows, result):
+    # Resolve every customer and package referenced by the chunk with one $in each
+    emails = list({row.get('customer') for _, row in rows})
+    hotel_names = list({row.get('hotel_name') for _, row in rows})
+    users = {u.email: u for u in User.objects(email__in=emails).only('email')}
+    packages = {}
+    for p in Package.objects(hotel_name__in=hotel_names).only('hotel_name', 'duration', 'unit_cost'):
+        packages.setdefault(p.hotel_name, p)  # same pick as Package.getPackage (first match)
+
+    docs = []
+    for line, row in rows:
+        customer = users.get(row.get('customer'))
+        package = packages.get(row.get('hotel_name'))
+        if customer is None:
+            result.error(line, f"no user with email {row.get('customer')!r}", row)
+            continue
+        if package is None:
+            result.error(line, f"no package for hotel {row.get('hotel_name')!r}", row)
+            continue
+        try:
+            check_in_date = dt.datetime.strptime(row['check_in_date'], "%Y-%m-%d")
+        except (KeyError, ValueError):
+            result.error(line, "check_in_date must be YYYY-MM-DD", row)
+            continue
+        docs.append((line, row, Booking.build_booking(check_in_date, customer, package)))
+    insert_chunk(Booking, docs, result)
+
+
+IMPORTERS = {
+    'Users': import_users,
+    'Package': import_packages,
+    'Booking': import_bookings,
+}
+
+
+def import_rows(rows, datatype, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """
+    Insert (line, row dict) pairs in insert_many chunks. on_chunk(result) is
+    called after every chunk (for progress; it may raise to stop the import).
+    Returns an ImportResult.
+    """
+    importer = IMPORTERS[datatype]
+    result = ImportResult(datatype)
+    try:
+        for chunk in chunked(rows, chunk_size):
+            importer(chunk, result)
+            result.processed += len(chunk)
+            if on_chunk:
+                on_chunk(result)
+    except (UnicodeDecodeError, csv.Error) as e:
+        result.error(None, f"could not read CSV: {e}")
+    return result
+
+
+def import_csv(stream, datatype, chunk_size=IMPORT_CHUNK_SIZE, on_chunk=None):
+    """Stream a CSV upload into MongoDB in insert_many chunks. Returns an ImportResult."""
+    return import_rows(read_csv_rows(stream), datatype, chunk_size, on_chunk)
@@ -0,0 +1,179 @@
+# Per-request performance instrumentation. Every request records its wall
+# time, template render time and the MongoDB commands it sent (through
+# database.command_monitor). The totals are returned in a Server-Timing
+# header, aggregated into histograms served at /metrics (Prometheus text
+# format), and requests slower than SLOW_REQUEST_MS are logged with their
+# query shapes.
+from flask import Blueprint, Response, g, request, before_render_template, template_rendered
+import threading
+import time
+from app.database import command_monitor, pool_monitor
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+metrics = Blueprint('metrics', __name__)
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label set (Prometheus semantics)."""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = format_labels(self.labels, label_values)
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{labels}}} {series["sum"]:.6f}')
+                lines.append(f'{self.name}_count{{{labels}}} {series["count"]}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{format_labels(self.labels, label_values)}}} {value}')
+        return lines
+
+
+def format_labels(names, values):
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for v in values)
+    return ','.join(f'{name}="{value}"' for name, value in zip(names, escaped))
+
+
+request_duration = Histogram('http_request_duration_seconds', 'Wall time per request.',
+                             ('endpoint', 'method'), LATENCY_BUCKETS)
+render_duration = Histogram('template_render_seconds', 'Template rendering time per request.',
+                            ('endpoint',), LATENCY_BUCKETS)
+db_duration = Histogram('mongodb_request_seconds', 'Time spent in MongoDB commands per request.',
+                        ('endpoint',), LATENCY_BUCKETS)
+db_commands = Histogram('mongodb_commands_per_request', 'MongoDB commands sent per request.',
+                        ('endpoint',), QUERY_COUNT_BUCKETS)
+command_duration = Histogram('mongodb_command_duration_seconds', 'Duration of each MongoDB command.',
+                             ('command',), LATENCY_BUCKETS)
+requests_total = Counter('http_requests_total', 'Requests by endpoint and status.',
+                         ('endpoint', 'method', 'status'))
+ALL_METRICS = (request_duration, render_duration, db_duration, db_commands, command_duration, requests_total)
+
+
+def endpoint_label():
+    # The route rule, not the URL, so /book/<id> is one series
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def start_request():
+    g.request_started = time.perf_counter()
+    g.render_time = 0.0
+    g.db_commands = command_monitor.start_recording()
+
+
+def template_started(sender, template, context, **extra):
+    if 'request_started' in g:
+        g.render_started = time.perf_counter()
+
+
+def template_finished(sender, template, context, **extra):
+    if 'render_started' in g:
+        g.render_time += time.perf_counter() - g.pop('render_started')
+
+
+def finish_request(app, response):
+    if 'request_started' not in g:
+        return response
+    wall = time.perf_counter() - g.request_started
+    commands = g.db_commands
+    command_monitor.stop_recording()
+    db_time = sum(duration for _, _, duration, _ in commands)
+
+    endpoint = endpoint_label()
+    request_duration.observe(wall, endpoint, request.method)
+    render_duration.observe(g.render_time, endpoint)
+    db_duration.observe(db_time, endpoint)
+    db_commands.observe(len(commands), endpoint)
+    for name, _, duration, _ in commands:
+        command_duration.observe(duration, name)
+    requests_total.inc(endpoint, request.method, response.status_code)
+
+    response.headers.add('Server-Timing', ', '.join([
+        f'db;desc="{len(commands)} queries";dur={db_time * 1000:.1f}',
+        f'render;dur={g.render_time * 1000:.1f}',
+        f'total;dur={wall * 1000:.1f}',
+    ]))
+
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    if slow_ms is not None and wall * 1000 >= slow_ms:
+        app.logger.warning('Slow request: %s %s took %.1f ms', request.method, request.path, wall * 1000, extra={
+            'endpoint': endpoint, 'status': response.status_code, 'duration_ms': round(wall * 1000, 1),
+            'db_ms': round(db_time * 1000, 1), 'render_ms': round(g.render_time * 1000, 1),
+            'queries': len(commands), 'query_shapes': summarize_commands(commands)})
+    return response
+
+
+def summarize_commands(commands):
+    """Count and total time per distinct query shape, slowest first."""
+    by_shape = {}
+    for _, shape, duration, ok in commands:
+        count, total = by_shape.get(shape, (0, 0.0))
+        by_shape[shape] = (count + 1, total + duration)
+    return [{'shape': shape, 'count': count, 'ms': round(total * 1000, 1)}
+            for shape, (count, total) in sorted(by_shape.items(), key=lambda item: -item[1][1])]
+
+
+@metrics.route('/metrics')
+def prometheus_metrics():
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    pool = pool_monitor.stats()
+    lines += ['# HELP mongodb_pool_checked_out Connections currently checked out of the pool.',
+              '# TYPE mongodb_pool_checked_out gauge',
+              f'mongodb_pool_checked_out {pool["checked_out"]}',
+              '# HELP mongodb_pool_checkout_failures_total Failed connection checkouts.',
+              '# TYPE mongodb_pool_checkout_failures_total counter',
+              f'mongodb_pool_checkout_failures_total {pool["checkout_failures"]}']
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_instrumentation(app):
+    if not app.config['INSTRUMENTATION_ENABLED']:
+        return
+    app.before_request(start_request)
+    app.after_request(lambda response: finish_request(app, response))
+    app.teardown_request(lambda exc: command_monitor.stop_recording())
+    before_render_template.connect(template_started, app)
+    template_rendered.connect(template_finished, app)
+    app.register_blueprint(metrics)
@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from app.importer import import_csv, import_rows
+from app.models.book import Booking
+from app.models.job import Job, JobCancelled
+from app.models.loan import Loan
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+# Long-running work runs here instead of in the request thread. Status lives
+# in the jobs collection, so any worker process can answer /jobs/<id>.
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='job')
+
+
+def run_job(job, work, *args):
+    """Run work(job, *args) and record how it ended."""
+    if Job.objects(id=job.id, cancel_requested=True).first():
+        job.finish('cancelled')
+        return
+    job.mark_running()
+    try:
+        work(job, *args)
+    except JobCancelled:
+        job.finish('cancelled')
+    except Exception as e:
+        logger.exception('Job failed', extra={'job_id': str(job.id), 'kind': job.kind})
+        job.finish('failed', error=str(e))
+
+
+def submit(kind, work, *args, owner=None, params=None):
+    job = Job.create(kind, owner=owner, params=params)
+    executor.submit(run_job, job, work, *args)
+    return job
+
+
+# ============================================================
+# CSV IMPORT
+# ============================================================
+
+def finish_import(job, result):
+    job.finish(
+        'done',
+        processed=result.processed, inserted=result.inserted,
+        skipped=result.skipped, failed=result.failed,
+        errors=[{'line': line, 'message': message} for line, message in result.errors],
+        # DictReader puts surplus columns under a None key, which MongoDB cannot store
+        failed_rows=[{'line': line, 'row': {k: v for k, v in row.items() if k is not None}}
+                     for line, row in result.failed_rows])
+
+
+def report_import_progress(job):
+    return lambda result: job.report_progress(result.processed, result.inserted, result.skipped, result.failed)
+
+
+def import_file(job, path, datatype):
+    try:
+        with open(path, 'rb') as stream:
+            result = import_csv(stream, datatype, on_chunk=report_import_progress(job))
+    finally:
+        os.remove(path)
+    finish_import(job, result)
+
+
+def import_failed_rows(job, source_job_id, datatype):
+    source = Job.objects(id=source_job_id).only('failed_rows').first()
+    rows = ((r['line'], r['row']) for r in source.failed_rows)
+    finish_import(job, import_rows(rows, datatype, on_chunk=report_import_progress(job)))
+
+
+def submit_import(upload, datatype, owner=None):
+    """Copy the upload to a temp file (the request is gone by the time it runs) and queue the import."""
+    fd, path = tempfile.mkstemp(prefix='upload-', suffix='.csv')
+    with os.fdopen(fd, 'wb') as out:
+        upload.save(out)
+    return submit('import', import_file, path, datatype,
+                  owner=owner, params={'datatype': datatype, 'filename': upload.filename})
+
+
+def submit_retry(source_job, owner=None):
+    """Queue a new import of just the rows that failed in source_job."""
+    datatype = source_job.params['datatype']
+    return submit('import', import_failed_rows, source_job.id, datatype,
+                  owner=owner, params={'datatype': datatype, 'retry_of': str(source_job.id)})
+
+
+# ============================================================
+# TREND CHART
+# ============================================================
+
+def build_trend(job, from_date, to_date, granularity):
+    trend = Booking.getCostTrend(from_date, to_date, granularity)
+    labels = sorted({period for points in trend.values() for period, _ in points})
+    # Hotel names can contain '.', which MongoDB keys cannot, so store a list
+    series = [{'hotel': hotel, 'points': [list(point) for point in points]} for hotel, points in trend.items()]
+    job.finish('done', processed=len(series),
+               result={'series': series, 'labels': labels, 'granularity': granularity})
+
+
+def submit_trend(from_date, to_date, granularity, owner=None):
+    return submit('trend', build_trend, from_date, to_date, granularity, owner=owner,
+                  params={'from': from_date, 'to': to_date, 'granularity': granularity})
+
+
+# ============================================================
+# OVERDUE SWEEP
+# ============================================================
+
+def sweep_overdue_loans(interval):
+    """Run Loan.mark_overdue_loans() every `interval` seconds, forever (daemon thread)."""
+    while True:
+        try:
+            marked = Loan.mark_overdue_loans()
+            if marked:
+                logger.info('Marked loans overdue', extra={'count': marked})
+        except Exception:
+            logger.exception('Overdue sweep failed')
+        time.sleep(interval)
+
+
+def start_overdue_sweeps(app):
+    """Start the sweep thread with the first request, so CLI commands don't run it."""
+    minutes = app.config['OVERDUE_SWEEP_MINUTES']
+    if not minutes:
+        return
+    started = threading.Event()
+
+    @app.before_request
+    def start_sweep_thread():
+        if not started.is_set():
+            started.set()
+            threading.Thread(target=sweep_overdue_loans, args=(minutes * 60,),
+                             name='overdue-sweep', daemon=True).start()
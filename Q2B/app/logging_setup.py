@@ -0,0 +1,107 @@
+# Structured logging. Modules log through logging.getLogger(__name__), which
+# falls under the 'app' logger (Flask's app.logger). Records are put on a queue
+# by a QueueHandler and written by a QueueListener thread, so request threads
+# never block on stdout. DEBUG records are sampled so hot-path events can't
+# flood the log, and logger.debug() is a level check and nothing more when
+# LOG_LEVEL is above DEBUG.
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+
+# LogRecord attributes that aren't `extra=` fields
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any extra= fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler that keeps extra= fields and the traceback separate from the message."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class DebugSampler(logging.Filter):
+    """Pass 1 in every `every` DEBUG records per call site; other levels always pass."""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.name, record.lineno)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        if seen % self.every:
+            return False
+        record.sampled_every = self.every
+        return True
+
+
+def configure_logging(app):
+    """Route the 'app' logger through a queue to stdout; call before app.logger is first used."""
+    global listener
+    stop_listener()
+
+    output = logging.StreamHandler(sys.stdout)
+    if app.config['LOG_FORMAT'] == 'json':
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(app.config['LOG_DEBUG_SAMPLE_EVERY']))
+
+    logger = logging.getLogger(app.name)
+    logger.handlers = [queue_handler]
+    logger.setLevel(app.config['LOG_LEVEL'])
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, output)
+    listener.start()
+
+
+@atexit.register
+def stop_listener():
+    """Write out whatever is still queued (runs at exit)."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
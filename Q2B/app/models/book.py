@@ -1,19 +1,32 @@
 from mongoengine import Document, DateTimeField, ReferenceField, FloatField
 from mongoengine.queryset.visitor import Q
+from datetime import timedelta
 from app.models.users import User
 from app.models.package import Package
+from app.database import read_only_collection
+
+TREND_GRANULARITIES = ('day', 'week', 'month')
+
 
 class Booking(Document):
     
-    meta = {'collection': 'booking'}
+    meta = {
+        'collection': 'booking',
+        'indexes': [
+            # getUserBookingsFromDate / getBooking: customer, check_in_date range
+            ('customer', 'check_in_date', 'package'),
+            # getCostTrend: date-range $match
+            ('check_in_date', 'package', 'total_cost'),
+        ]
+    }
     check_in_date = DateTimeField(required=True)
     customer = ReferenceField(User)
     package = ReferenceField(Package)
     total_cost = FloatField()
     
     def calculate_total_cost(self):
-        self.total_cost = self.package.duration * self.package.unit_cost
-        self.save()
+        """Set total_cost from the package; saving is left to the caller."""
+        self.total_cost = self.package.packageCost()
 
     @staticmethod
     def getBookingsByEmail(email):
@@ -27,10 +40,85 @@ class Booking(Document):
         return Booking.objects()           
             
     @staticmethod
-    def createBooking(check_in_date, customer, package):
-        booking = Booking(check_in_date=check_in_date, customer=customer, package=package).save()
+    def getCostTrend(from_date=None, to_date=None, granularity='day'):
+        """
+        Total booking cost per hotel per day/week/month, computed in MongoDB.
+
+        Bookings are first summed per (package, period) so the $lookup only
+        runs once per distinct package and period, not once per booking.
+
+        Returns:
+            dict: {hotel_name: [(period_start, total_cost), ...]} sorted by period
+        """
+        if granularity not in TREND_GRANULARITIES:
+            raise ValueError(f"granularity must be one of {TREND_GRANULARITIES}")
+
+        date_range = {}
+        if from_date:
+            date_range['$gte'] = from_date
+        if to_date:
+            date_range['$lt'] = to_date + timedelta(days=1)  # to_date is inclusive
+
+        period = {'date': '$check_in_date', 'unit': granularity}
+        if granularity == 'week':
+            period['startOfWeek'] = 'monday'
+
+        pipeline = []
+        if date_range:
+            pipeline.append({'$match': {'check_in_date': date_range}})
+        pipeline += [
+            {'$group': {
+                '_id': {
+                    'package': '$package',
+                    'period': {'$dateTrunc': period},
+                },
+                'total': {'$sum': '$total_cost'},
+            }},
+            {'$lookup': {
+                'from': Package._get_collection_name(),
+                'localField': '_id.package',
+                'foreignField': '_id',
+                'as': 'package',
+            }},
+            {'$unwind': '$package'},
+            {'$group': {
+                '_id': {'hotel': '$package.hotel_name', 'period': '$_id.period'},
+                'total': {'$sum': '$total'},
+            }},
+            {'$sort': {'_id.hotel': 1, '_id.period': 1}},
+        ]
+
+        trend = {}
+        for row in read_only_collection(Booking).aggregate(pipeline, allowDiskUse=True):
+            trend.setdefault(row['_id']['hotel'], []).append((row['_id']['period'], row['total']))
+        return trend
+
+    @staticmethod
+    def build_booking(check_in_date, customer, package):
+        """An unsaved Booking with total_cost already worked out from the loaded package."""
+        booking = Booking(check_in_date=check_in_date, customer=customer, package=package)
         booking.calculate_total_cost()
         return booking
+
+    @staticmethod
+    def createBooking(check_in_date, customer, package):
+        # One insert: the cost is known before the first (and only) write
+        return Booking.build_booking(check_in_date, customer, package).save(force_insert=True)
+
+    @staticmethod
+    def create_many(bookings):
+        """
+        Insert (check_in_date, customer, package) triples with one insert_many.
+        Returns the saved Bookings; nothing is inserted if any of them is invalid.
+        """
+        docs = [Booking.build_booking(*booking) for booking in bookings]
+        for doc in docs:
+            doc.validate()
+        if docs:
+            Booking.objects.insert(docs, load_bulk=False)
+            for doc in docs:
+                doc._created = False  # a later save() updates instead of inserting again
+        return docs
               
     @staticmethod
     def getUserBookingsFromDate(customer, from_date):
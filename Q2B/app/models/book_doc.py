@@ -1,8 +1,108 @@
-from mongoengine import Document, StringField, ListField, IntField
+from mongoengine import Document, StringField, ListField, IntField, signals
+from mongoengine.queryset.visitor import Q
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+import base64
+import threading
+from app.cache import TTLCache
+from app.database import read_only, read_only_collection
 from app.models.books import all_books
 
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Fields a catalog card needs; list views load only these, never the full description
+CARD_FIELDS = ('title', 'authors', 'category', 'genres', 'pages', 'url', 'available', 'short_description')
+
+# Bump SEED_VERSION whenever all_books or the stored book fields change so
+# `flask seed-books` re-runs
+SEED_VERSION = 2
+SEED_CHUNK_SIZE = 500
+
+# Rendered catalog pages, keyed by ('page', category, sort, after, limit) and
+# ('count', category). Availability is kept apart in book_availability so a
+# loan or return updates one number instead of evicting the page.
+CATALOG_CACHE_SIZE = 256
+CATALOG_CACHE_TTL = 300
+catalog_cache = TTLCache(maxsize=CATALOG_CACHE_SIZE, ttl=CATALOG_CACHE_TTL)
+book_availability = {}  # str(book id) -> available
+_availability_lock = threading.Lock()
+
+
+def encode_cursor(book):
+    """Encode the (title, _id) keyset position of a book as a URL-safe token."""
+    raw = f"{book.title}\x00{book.id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(token):
+    """Decode a token from encode_cursor(). Returns (title, ObjectId) or None if invalid."""
+    if not token:
+        return None
+    try:
+        title, oid = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8').split('\x00', 1)
+        return title, ObjectId(oid)
+    except (ValueError, UnicodeError, InvalidId):
+        return None
+
+
+class CatalogPage:
+    """
+    One keyset page of the catalog, iterated lazily from the database cursor.
+
+    Fetches at most limit + 1 documents; the extra one only tells us whether
+    there is a next page. next_after is filled in once iteration reaches the
+    end of the page, so templates should read it after the loop.
+    """
+
+    def __init__(self, queryset, limit):
+        self._cursor = queryset.limit(limit + 1)
+        self.limit = limit
+        self.has_next = False
+        self.next_after = None
+
+    def __iter__(self):
+        last = None
+        for n, book in enumerate(self._cursor):
+            if n == self.limit:
+                self.has_next = True
+                self.next_after = encode_cursor(last)
+                break
+            last = book
+            yield book
+
+
+class CachedCatalogPage:
+    """A cached catalog page whose cards pick up the latest availability on each render."""
+
+    def __init__(self, cards, has_next, next_after):
+        self.cards = cards
+        self.has_next = has_next
+        self.next_after = next_after
+
+    def __iter__(self):
+        for card in self.cards:
+            yield dict(card, available=book_availability.get(card['id'], card['available']))
+
+
 class Book(Document):
-    meta = {"collection": "books"}
+    meta = {
+        "collection": "books",
+        "indexes": [
+            # Catalog listing filtered by category, sorted by title
+            ("category", "title", "id"),
+            ("title", "id"),
+            # Search: ranked text match plus multikey author/genre filters
+            {
+                "fields": ["$title", "$authors", "$description"],
+                "default_language": "english",
+                "weights": {"title": 10, "authors": 5, "description": 1},
+            },
+            ("genres", "title"),
+            ("authors", "title"),
+        ]
+    }
 
     # Fields matching the database schema
     title = StringField(required=True, unique=True, max_length=300)
@@ -14,71 +114,295 @@ class Book(Document):
     pages = IntField()
     available = IntField()
     copies = IntField()
+    # First and last description paragraphs, precomputed on save for list views
+    short_description = StringField(default="")
 
-    @property
-    def short_description(self):
+    @staticmethod
+    def summarize(description):
         """Returns first and last paragraph of description."""
-        if not self.description:
+        if not description:
             return ""
-        parts = [p.strip() for p in self.description if p and p.strip()]
+        parts = [p.strip() for p in description if p and p.strip()]
         if not parts:
             return ""
         if len(parts) == 1:
             return parts[0]
         return f"{parts[0]} ... {parts[-1]}"
 
+    def clean(self):
+        # Called by validate() on every save(); skip when description is unchanged
+        # so saving a document loaded with .only() never blanks the summary
+        if self._created or 'description' in self._changed_fields:
+            self.short_description = Book.summarize(self.description)
+
     @classmethod
-    def seed_from_all_books_if_empty(cls):
-        """Populate MongoDB from all_books if collection is empty."""
-        if cls.objects.count() > 0:
-            return  # Already seeded
-        
-        docs = []
-        for b in all_books:
-            docs.append(cls(
-                title=b["title"],
-                category=b.get("category", ""),
-                url=b.get("url", ""),
-                description=b.get("description", []),
-                authors=b.get("authors", []),
-                genres=b.get("genres", []),
-                pages=b.get("pages", 0),
-                available=b.get("available", 0),
-                copies=b.get("copies", 0),
-            ))
-        if docs:
-            cls.objects.insert(docs, load_bulk=False)
+    def seed_from_all_books(cls, chunk_size=SEED_CHUNK_SIZE):
+        """
+        Upsert every entry of all_books by title, in unordered bulk chunks.
+
+        Existing titles are left untouched ($setOnInsert), so re-running the
+        seed never resets availability of books already in the database.
+
+        Returns:
+            tuple: (inserted, matched) counts
+        """
+        collection = cls._get_collection()
+        inserted = matched = 0
+        for start in range(0, len(all_books), chunk_size):
+            requests = []
+            for b in all_books[start:start + chunk_size]:
+                doc = cls(
+                    title=b["title"],
+                    category=b.get("category", ""),
+                    url=b.get("url", ""),
+                    description=b.get("description", []),
+                    short_description=cls.summarize(b.get("description", [])),
+                    authors=b.get("authors", []),
+                    genres=b.get("genres", []),
+                    pages=b.get("pages", 0),
+                    available=b.get("available", 0),
+                    copies=b.get("copies", 0),
+                ).to_mongo().to_dict()
+                requests.append(UpdateOne({"title": doc["title"]}, {"$setOnInsert": doc}, upsert=True))
+            if requests:
+                result = collection.bulk_write(requests, ordered=False)
+                inserted += result.upserted_count
+                matched += result.matched_count
+        return inserted, matched
+
+    @classmethod
+    def backfill_short_descriptions(cls, chunk_size=SEED_CHUNK_SIZE):
+        """Store short_description on books saved before it was a field. Returns the count updated."""
+        collection = cls._get_collection()
+        cursor = collection.find({"short_description": {"$exists": False}}, {"description": 1})
+        updated = 0
+        requests = []
+        for doc in cursor:
+            summary = cls.summarize(doc.get("description", []))
+            requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"short_description": summary}}))
+            if len(requests) == chunk_size:
+                updated += collection.bulk_write(requests, ordered=False).modified_count
+                requests = []
+        if requests:
+            updated += collection.bulk_write(requests, ordered=False).modified_count
+        return updated
 
     # ============================================================
     # NEW METHODS FOR BORROWING AND RETURNING BOOKS
     # ============================================================
     
+    # Both methods apply a single conditional $inc (find_one_and_update), so
+    # concurrent loans of the last copy cannot both succeed and never
+    # overwrite each other's counts. The checks live in the update filter.
+
     def borrow_book(self):
-        if self.available <= 0:
+        updated = Book.objects(
+            id=self.id,
+            available__gt=0,
+            __raw__={'$expr': {'$lte': ['$available', '$copies']}}
+        ).only('available', 'copies').modify(dec__available=1, new=True)
+
+        if updated is None:
+            # Lost the race or the counts are inconsistent; report the current state
+            self.reload('available', 'copies')
+            if self.available > self.copies:
+                return False, f"Data error: Available copies ({self.available}) exceeds total copies ({self.copies})."
             return False, f"Cannot borrow '{self.title}'. No copies available."
-        
-        if self.available > self.copies:
-            return False, f"Data error: Available copies ({self.available}) exceeds total copies ({self.copies})."
-        
-        # Decrease available count
-        self.available -= 1
-        self.save()
-        
+
+        self._set_available(updated.available)
         return True, f"Successfully borrowed '{self.title}'. {self.available} copies remaining."
     
     def return_book(self):
-        if self.available >= self.copies:
+        updated = Book.objects(
+            id=self.id,
+            available__gte=0,
+            __raw__={'$expr': {'$lt': ['$available', '$copies']}}
+        ).only('available', 'copies').modify(inc__available=1, new=True)
+
+        if updated is None:
+            self.reload('available', 'copies')
+            if self.available < 0:
+                return False, f"Data error: Available count ({self.available}) is negative."
             return False, f"Cannot return '{self.title}'. All {self.copies} copies are already available (none borrowed)."
-        
-        if self.available < 0:
-            return False, f"Data error: Available count ({self.available}) is negative."
-        
-        # Increase available count
-        self.available += 1
-        self.save()
-        
+
+        self._set_available(updated.available)
         return True, f"Successfully returned '{self.title}'. {self.available} of {self.copies} copies now available."
+
+    @staticmethod
+    def return_copies(counts):
+        """
+        Put back counts[book_id] copies of each book with one bulk_write.
+        Each book gets a single grouped increment, capped at `copies`, so
+        inconsistent counts can't push `available` past the total.
+
+        Returns:
+            dict: {book_id: available after the update}
+        """
+        if not counts:
+            return {}
+        Book._get_collection().bulk_write([
+            UpdateOne({'_id': book_id}, [{'$set': {'available': {'$min': [{'$add': ['$available', n]}, '$copies']}}}])
+            for book_id, n in counts.items()
+        ], ordered=False)
+        available = {book.id: book.available for book in Book.objects(id__in=list(counts)).only('available')}
+        for book_id, count in available.items():
+            set_cached_availability(book_id, count)
+        return available
+
+    def _set_available(self, available):
+        """Reflect an atomic update locally without marking `available` dirty for a later save()."""
+        self._data['available'] = available
+        # modify() bypasses post_save, so refresh the catalog cache here
+        set_cached_availability(self.id, available)
     
+    # ============================================================
+    # CATALOG LISTING (keyset pagination on title, _id)
+    # ============================================================
+
+    @staticmethod
+    def catalog_query(category='All'):
+        if category == 'All':
+            return read_only(Book.objects())
+        return read_only(Book.objects(category=category))
+
+    @staticmethod
+    def count_titles(category='All'):
+        """Count titles in a category without loading any documents."""
+        return Book.catalog_query(category).count()
+
+    @staticmethod
+    def get_catalog_page(category='All', after=None, limit=DEFAULT_PAGE_SIZE):
+        """
+        Return a CatalogPage of books sorted by (title, _id), starting after
+        the position encoded in the `after` token.
+        """
+        books_query = Book.catalog_query(category)
+        position = decode_cursor(after)
+        if position:
+            title, oid = position
+            books_query = books_query.filter(Q(title__gt=title) | (Q(title=title) & Q(id__gt=oid)))
+        books_query = books_query.only(*CARD_FIELDS).order_by('title', 'id').no_cache()
+        return CatalogPage(books_query, limit)
+
+    @staticmethod
+    def get_cached_catalog_page(category='All', after=None, limit=DEFAULT_PAGE_SIZE):
+        """Same page as get_catalog_page(), served from catalog_cache when possible."""
+        key = ('page', category, 'title', after, limit)
+        page = catalog_cache.get(key)
+        if page is None:
+            live_page = Book.get_catalog_page(category=category, after=after, limit=limit)
+            cards = [book.to_card() for book in live_page]
+            page = CachedCatalogPage(cards, live_page.has_next, live_page.next_after)
+            with _availability_lock:
+                for card in cards:
+                    book_availability[card['id']] = card['available']
+            catalog_cache.set(key, page)
+        return page
+
+    # ============================================================
+    # SEARCH (text index + $facet counts)
+    # ============================================================
+
+    @staticmethod
+    def search_filters(category='All', genre=None, author=None):
+        filters = {}
+        if category and category != 'All':
+            filters['category'] = category
+        if genre:
+            filters['genres'] = genre
+        if author:
+            filters['authors'] = author
+        return filters
+
+    @staticmethod
+    def search(text=None, category='All', genre=None, author=None, page=1, limit=DEFAULT_PAGE_SIZE):
+        """
+        One page of books matching the text/filters, best text match first
+        (alphabetical when there is no search text).
+        """
+        books_query = read_only(Book.objects(**Book.search_filters(category, genre, author))).only(*CARD_FIELDS)
+        if text:
+            books_query = books_query.search_text(text).order_by('$text_score', 'title')
+        else:
+            books_query = books_query.order_by('title', 'id')
+        return books_query.skip((page - 1) * limit).limit(limit).no_cache()
+
+    @staticmethod
+    def search_facets(text=None, category='All', genre=None, author=None):
+        """
+        Facet counts for a search. Without search text (the sidebar's plain
+        /search) they only change with the catalog, so they are kept in
+        catalog_cache and dropped by the Book signals like the catalog pages.
+        """
+        if text:
+            return Book.count_facets(text, category, genre, author)
+        key = ('facets', category, genre, author)
+        facets = catalog_cache.get(key)
+        if facets is None:
+            facets = Book.count_facets(None, category, genre, author)
+            catalog_cache.set(key, facets)
+        return facets
+
+    @staticmethod
+    def count_facets(text=None, category='All', genre=None, author=None):
+        """
+        Counts for the same search in one aggregation: per category, per genre
+        and per (category, genre) pair.
+        """
+        match = dict(Book.search_filters(category, genre, author))
+        if text:
+            match['$text'] = {'$search': text}
+        pipeline = [
+            {'$match': match},
+            {'$facet': {
+                'categories': [
+                    {'$group': {'_id': '$category', 'count': {'$sum': 1}}},
+                    {'$sort': {'_id': 1}},
+                ],
+                'genres': [
+                    {'$unwind': '$genres'},
+                    {'$group': {'_id': '$genres', 'count': {'$sum': 1}}},
+                    {'$sort': {'count': -1, '_id': 1}},
+                ],
+                'category_genres': [
+                    {'$unwind': '$genres'},
+                    {'$group': {'_id': {'category': '$category', 'genre': '$genres'}, 'count': {'$sum': 1}}},
+                    {'$sort': {'_id.category': 1, '_id.genre': 1}},
+                ],
+            }},
+        ]
+        result = next(read_only_collection(Book).aggregate(pipeline), {})
+        return {
+            'total': sum(c['count'] for c in result.get('categories', [])),
+            'categories': [(c['_id'], c['count']) for c in result.get('categories', [])],
+            'genres': [(g['_id'], g['count']) for g in result.get('genres', [])],
+            'category_genres': [(cg['_id']['category'], cg['_id']['genre'], cg['count'])
+                                for cg in result.get('category_genres', [])],
+        }
+
+    @staticmethod
+    def count_cached_titles(category='All'):
+        key = ('count', category)
+        total = catalog_cache.get(key)
+        if total is None:
+            total = Book.count_titles(category)
+            catalog_cache.set(key, total)
+        return total
+
+    def to_card(self):
+        """Plain dict with just the fields a catalog card shows."""
+        return {
+            'id': str(self.id),
+            'title': self.title,
+            'authors': list(self.authors),
+            'category': self.category,
+            'genres': list(self.genres),
+            'pages': self.pages,
+            'url': self.url,
+            'available': self.available,
+            'short_description': self.short_description,
+        }
+
     @staticmethod
     def get_book_by_title(title):
         return Book.objects(title=title).first()
@@ -93,4 +417,43 @@ class Book(Document):
         Returns:
             int: Number of borrowed copies
         """
-        return self.copies - self.available
\ No newline at end of file
+        return self.copies - self.available
+
+
+# ============================================================
+# CATALOG CACHE INVALIDATION
+# ============================================================
+
+def set_cached_availability(book_id, available):
+    """Record a new available count without evicting any cached page."""
+    with _availability_lock:
+        if str(book_id) in book_availability:
+            book_availability[str(book_id)] = available
+
+
+def invalidate_catalog(category=None):
+    """Drop cached pages and counts for `category` and 'All' (everything if None)."""
+    if category is None:
+        catalog_cache.invalidate()
+        with _availability_lock:
+            book_availability.clear()
+    else:
+        catalog_cache.invalidate(lambda key: key[1] in (category, 'All'))
+
+
+def _on_book_saved(sender, document, created=False, **kwargs):
+    changed = set(getattr(document, '_changed_fields', []))
+    if not created and changed <= {'available'}:
+        set_cached_availability(document.id, document.available)
+    elif 'category' in changed:
+        invalidate_catalog()  # old category is no longer known here
+    else:
+        invalidate_catalog(document.category)
+
+
+def _on_book_deleted(sender, document, **kwargs):
+    invalidate_catalog(document.category)
+
+
+signals.post_save.connect(_on_book_saved, sender=Book)
+signals.post_delete.connect(_on_book_deleted, sender=Book)
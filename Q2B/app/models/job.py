@@ -0,0 +1,113 @@
+from mongoengine import (Document, StringField, IntField, BooleanField, DateTimeField, DictField,
+                         ListField, ObjectIdField, ValidationError)
+from datetime import datetime
+import os
+
+JOB_STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+# Finished jobs are deleted by MongoDB's TTL monitor this long after finished_at
+JOB_RETENTION_SECONDS = int(os.environ.get('JOB_RETENTION_SECONDS', 7 * 24 * 3600))
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class Job(Document):
+    """
+    Background job record, polled by the client through /jobs/<id>.
+
+    Fields:
+    - kind: 'import' or 'trend'
+    - owner: Id of the User who submitted it (None for anonymous)
+    - params: What the job was asked to do (datatype, date range, ...)
+    - status: One of JOB_STATUSES
+    - processed/inserted/skipped/failed: Progress counts, updated per chunk
+    - errors: First row errors as {'line', 'message'}
+    - failed_rows: Failed CSV rows kept for "retry failed rows"
+    - result: Output of the job (e.g. chart data)
+    - cancel_requested: Set by /jobs/<id>/cancel, checked between chunks
+    """
+
+    meta = {
+        'collection': 'jobs',
+        'indexes': [
+            ('owner', '-created_at'),
+            # TTL: queued/running jobs have no finished_at, so only finished ones expire
+            {'fields': ['finished_at'], 'expireAfterSeconds': JOB_RETENTION_SECONDS},
+        ],
+    }
+
+    kind = StringField(required=True)
+    owner = ObjectIdField()
+    params = DictField()
+    status = StringField(choices=JOB_STATUSES, default='queued')
+    processed = IntField(default=0)
+    inserted = IntField(default=0)
+    skipped = IntField(default=0)
+    failed = IntField(default=0)
+    errors = ListField(DictField())
+    failed_rows = ListField(DictField())
+    result = DictField()
+    error = StringField()
+    cancel_requested = BooleanField(default=False)
+    created_at = DateTimeField(default=datetime.now)
+    started_at = DateTimeField()
+    finished_at = DateTimeField()
+
+    @staticmethod
+    def create(kind, owner=None, params=None):
+        return Job(kind=kind, owner=owner, params=params or {}).save()
+
+    @staticmethod
+    def get_job(job_id, owner=None):
+        """The job with this id, as long as it belongs to `owner` (or to nobody)."""
+        try:
+            job = Job.objects(id=job_id).exclude('failed_rows').first()
+        except ValidationError:
+            return None  # not an ObjectId
+        if job and job.owner is not None and job.owner != owner:
+            return None
+        return job
+
+    def is_finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def mark_running(self):
+        Job.objects(id=self.id).update_one(set__status='running', set__started_at=datetime.now())
+
+    def report_progress(self, processed, inserted=0, skipped=0, failed=0):
+        """Save progress counts; raises JobCancelled if cancellation was requested."""
+        updated = Job.objects(id=self.id).only('cancel_requested').modify(
+            set__processed=processed, set__inserted=inserted, set__skipped=skipped, set__failed=failed,
+            new=True)
+        if updated is None or updated.cancel_requested:
+            raise JobCancelled()
+
+    def finish(self, status, **fields):
+        Job.objects(id=self.id).update_one(
+            set__status=status, set__finished_at=datetime.now(),
+            **{f'set__{name}': value for name, value in fields.items()})
+
+    def request_cancel(self):
+        """Ask a queued or running job to stop. Returns False if it already finished."""
+        return Job.objects(id=self.id, status__in=['queued', 'running']).update_one(
+            set__cancel_requested=True) == 1
+
+    def to_status(self):
+        """JSON-ready status for /jobs/<id>."""
+        return {
+            'id': str(self.id),
+            'kind': self.kind,
+            'status': self.status,
+            'processed': self.processed,
+            'inserted': self.inserted,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'errors': self.errors,
+            'error': self.error,
+            'result': self.result,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
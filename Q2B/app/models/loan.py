@@ -1,8 +1,40 @@
-from mongoengine import Document, ReferenceField, DateTimeField, IntField, BooleanField
-from datetime import datetime
+from mongoengine import (Document, EmbeddedDocument, ReferenceField, DateTimeField, IntField, BooleanField,
+                         StringField, ListField, EmbeddedDocumentField, NotUniqueError, ValidationError)
+from pymongo import UpdateMany
+from bson import ObjectId
+from bson.errors import InvalidId
+from datetime import datetime, timedelta
 from app.models.users import User
 from app.models.book_doc import Book
 
+# Bump when stored loan fields change so `flask migrate-loans` re-runs
+LOAN_SCHEMA_VERSION = 3
+
+LOANS_PER_PAGE = 20
+LOAN_PERIOD = timedelta(days=14)
+# 'overdue' is set by mark_overdue_loans() once due_date has passed
+LOAN_STATUSES = ('active', 'overdue', 'returned')
+
+# Fields renew_loan / return_loan / delete_loan read (see get_user_loan)
+RENEW_FIELDS = ('return_date', 'renew_count', 'book_snapshot.title', 'book')
+RETURN_FIELDS = ('return_date', 'book_snapshot.title', 'book')
+DELETE_FIELDS = ('return_date', 'book_snapshot.title', 'book')
+
+BULK_ACTIONS = ('renew', 'return')
+MAX_BULK_LOANS = 200
+
+
+class BookSnapshot(EmbeddedDocument):
+    """Copy of the book fields the loan pages show, so listing loans never dereferences Book."""
+    title = StringField()
+    url = StringField()
+    authors = ListField(StringField())
+
+    @staticmethod
+    def of(book):
+        return BookSnapshot(title=book.title, url=book.url, authors=list(book.authors or []))
+
+
 class Loan(Document):
     """
     Loan model to track book borrowing by users.
@@ -13,15 +45,43 @@ class Loan(Document):
     - borrow_date: Date when book was borrowed
     - return_date: Date when book was returned (None if not yet returned)
     - renew_count: Number of times loan has been renewed
+    - active: True until the book is returned (backs the one-active-loan index)
+    - book_snapshot: Title, cover url and authors of the book at loan time
+    - due_date: borrow_date + LOAN_PERIOD, moved on by renewals
+    - status: active, overdue or returned
     """
     
-    meta = {'collection': 'loans'}
+    meta = {
+        'collection': 'loans',
+        'indexes': [
+            # get_user_loans: borrower (+ return_date=None), newest first
+            ('borrower', 'return_date', '-borrow_date'),
+            ('borrower', '-borrow_date'),
+            # get_user_loans_page: active loans first, newest first
+            ('borrower', '-active', '-borrow_date'),
+            # get_specific_loan / create_loan duplicate check
+            ('borrower', 'book', 'return_date'),
+            # get_all_overdue_loans and the mark_overdue_loans sweep
+            ('status', 'due_date'),
+            # At most one active loan per (borrower, book); enforced by MongoDB
+            {
+                'fields': ['borrower', 'book'],
+                'unique': True,
+                'partialFilterExpression': {'active': True},
+                'name': 'one_active_loan_per_book',
+            },
+        ]
+    }
     
     borrower = ReferenceField(User, required=True)
     book = ReferenceField(Book, required=True)
     borrow_date = DateTimeField(required=True)
     return_date = DateTimeField(default=None)
     renew_count = IntField(default=0)
+    active = BooleanField(default=True)
+    book_snapshot = EmbeddedDocumentField(BookSnapshot)
+    due_date = DateTimeField()
+    status = StringField(choices=LOAN_STATUSES, default='active')
     
     # ============================================================
     # CREATE LOAN
@@ -29,36 +89,41 @@ class Loan(Document):
     
     @staticmethod
     def create_loan(borrower, book, borrow_date):
-        # Check if book has available copies
+        """
+        Create a loan in two ordered writes: take a copy with the conditional
+        $inc in Book.borrow_book(), then insert the loan.
+
+        The partial unique index rejects a second active loan for the same
+        (borrower, book), so "already borrowed" needs no separate lookup; the
+        copy is put back in that case. A loan is never visible without the
+        copy it holds.
+        """
+        # Check the book as loaded (re-checked atomically by borrow_book)
         if book.available <= 0:
             return False, f"Cannot create loan. '{book.title}' has no available copies.", None
         
-        # Check if user already has an unreturned loan for this book
-        existing_loan = Loan.objects(
-            borrower=borrower,
-            book=book,
-            return_date=None  # Unreturned loans have return_date = None
-        ).first()
-        
-        if existing_loan:
-            return False, f"You already have an unreturned loan for '{book.title}'.", None
+        # Update book's available count
+        success, message = book.borrow_book()
+        if not success:
+            return False, message, None
         
-        # Create the loan
         loan = Loan(
             borrower=borrower,
             book=book,
             borrow_date=borrow_date,
             return_date=None,
-            renew_count=0
+            renew_count=0,
+            active=True,
+            book_snapshot=BookSnapshot.of(book),
+            due_date=borrow_date + LOAN_PERIOD,
+            status='active'
         )
-        loan.save()
-        
-        # Update book's available count
-        success, message = book.borrow_book()
-        if not success:
-            # Rollback: delete the loan if book update fails
-            loan.delete()
-            return False, message, None
+        try:
+            loan.save(force_insert=True)
+        except NotUniqueError:
+            # Already borrowed: give back the copy taken above
+            book.return_book()
+            return False, f"You already have an unreturned loan for '{book.title}'.", None
         
         return True, f"Successfully borrowed '{book.title}'.", loan
     
@@ -73,6 +138,22 @@ class Loan(Document):
         else:
             return Loan.objects(borrower=borrower, return_date=None).order_by('-borrow_date')
     
+    @staticmethod
+    def get_user_loans_page(borrower, page=1, limit=LOANS_PER_PAGE):
+        """
+        One page of a user's loans, active loans first and newest first.
+
+        Book details come from book_snapshot, so the page is a single query.
+
+        Returns:
+            tuple: (list of Loan, has_next)
+        """
+        loans = list(Loan.objects(borrower=borrower)
+                     .order_by('-active', '-borrow_date')
+                     .skip((page - 1) * limit)
+                     .limit(limit + 1))
+        return loans[:limit], len(loans) > limit
+
     @staticmethod
     def get_loan_by_id(loan_id):
         """
@@ -85,6 +166,21 @@ class Loan(Document):
             Loan or None
         """
         return Loan.objects(id=loan_id).first()
+
+    @staticmethod
+    def get_user_loan(loan_id, borrower_id, fields):
+        """
+        The loan with this id if it belongs to borrower_id, loading only
+        `fields`. Ownership is part of the query, so the borrower is never
+        dereferenced, and `book` stays an unfetched reference.
+
+        Returns:
+            Loan or None (also for a malformed id)
+        """
+        try:
+            return Loan.objects(id=loan_id, borrower=borrower_id).only(*fields).no_dereference().first()
+        except ValidationError:
+            return None
     
     @staticmethod
     def get_specific_loan(borrower, book, unreturned_only=True):
@@ -104,11 +200,16 @@ class Loan(Document):
         if new_borrow_date is None:
             new_borrow_date = datetime.now()
         
-        self.borrow_date = new_borrow_date
+        # Only while still active: a renew racing a return must not reopen the loan.
+        # update_one() writes just these fields, so loans loaded with only() can be renewed
+        renewed = Loan.objects(id=self.id, active=True).update_one(
+            set__borrow_date=new_borrow_date, set__due_date=new_borrow_date + LOAN_PERIOD,
+            set__status='active', inc__renew_count=1)
+        if not renewed:
+            return False, "Cannot renew. This loan has already been returned."
         self.renew_count += 1
-        self.save()
         
-        return True, f"Successfully renewed '{self.book.title}'. Renewal count: {self.renew_count}."
+        return True, f"Successfully renewed '{self.book_title}'. Renewal count: {self.renew_count}."
     
     # ============================================================
     # UPDATE LOAN - RETURN
@@ -121,26 +222,120 @@ class Loan(Document):
         if return_date is None:
             return_date = datetime.now()
         
-        # Update book's available count
-        success, message = self.book.return_book()
+        # Claim the loan first; of two concurrent returns only one matches active=True,
+        # so only one puts the copy back
+        claimed = Loan.objects(id=self.id, active=True).update_one(
+            set__return_date=return_date, set__active=False, set__status='returned')
+        if not claimed:
+            return False, "This loan has already been returned."
+        
+        # Update book's available count (loading only the fields return_book needs)
+        book = Book.objects(id=self.book.id).only('title', 'available', 'copies').first()
+        if book is None:
+            success, message = False, "the book no longer exists."
+        else:
+            success, message = book.return_book()
         if not success:
+            # Undo the claim; the sweep re-marks the loan overdue if it is past due
+            Loan.objects(id=self.id, return_date=return_date).update_one(
+                set__return_date=None, set__active=True, set__status='active')
             return False, f"Failed to update book availability: {message}"
         
-        # Mark loan as returned
         self.return_date = return_date
-        self.save()
         
-        return True, f"Successfully returned '{self.book.title}'."
+        return True, f"Successfully returned '{self.book_title}'."
     
+    # ============================================================
+    # BULK RENEW / RETURN
+    # ============================================================
+
+    @staticmethod
+    def bulk_update(borrower, loan_ids, action):
+        """
+        Renew or return many of the borrower's loans with a fixed number of
+        round trips: one query finds the borrower's loans among loan_ids,
+        one update_many changes all eligible loans (they all get the same
+        dates) and, for returns, Book.return_copies() puts the copies back
+        grouped by book.
+
+        Returns:
+            list of {'loan_id', 'ok', 'message'}, one per distinct id in loan_ids
+        """
+        if action not in BULK_ACTIONS:
+            raise ValueError(f"action must be one of {BULK_ACTIONS}")
+
+        ids = {}  # loan_id as sent -> ObjectId (None when malformed)
+        for loan_id in loan_ids:
+            try:
+                ids[loan_id] = ObjectId(loan_id)
+            except (InvalidId, TypeError):
+                ids[loan_id] = None
+        ids_to_check = list(dict.fromkeys(oid for oid in ids.values() if oid))
+
+        # Ownership check and eligibility in one query
+        loans = {loan['_id']: loan for loan in Loan.objects(id__in=ids_to_check, borrower=borrower)
+                 .only('book', 'return_date', 'book_snapshot.title').as_pymongo()}
+        results = {}
+        eligible = []
+        for oid in ids_to_check:
+            loan = loans.get(oid)
+            if loan is None:
+                results[oid] = (False, "Loan not found.")
+            elif loan.get('return_date') is not None:
+                results[oid] = (False, f"This loan has already been returned on {loan['return_date'].strftime('%d/%m/%Y')}.")
+            else:
+                eligible.append(oid)
+
+        # MongoDB stores milliseconds; truncating lets the stamp be matched exactly below
+        now = datetime.now()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        if action == 'renew':
+            stamp = 'borrow_date'
+            update = {'$set': {'borrow_date': now, 'due_date': now + LOAN_PERIOD, 'status': 'active'},
+                      '$inc': {'renew_count': 1}}
+        else:
+            stamp = 'return_date'
+            update = {'$set': {'return_date': now, 'active': False, 'status': 'returned'}}
+
+        changed = eligible
+        if eligible:
+            collection = Loan._get_collection()
+            modified = collection.update_many({'_id': {'$in': eligible}, 'active': True}, update).modified_count
+            if modified != len(eligible):
+                # Some loans were returned concurrently; keep only the ones this update stamped
+                changed = [loan['_id'] for loan in collection.find({'_id': {'$in': eligible}, stamp: now}, {'_id': 1})]
+
+        changed_set = set(changed)
+        if action == 'return':
+            counts = {}
+            for oid in changed:
+                counts[loans[oid]['book']] = counts.get(loans[oid]['book'], 0) + 1
+            Book.return_copies(counts)
+
+        for oid in eligible:
+            title = loans[oid].get('book_snapshot', {}).get('title', 'this book')
+            if oid not in changed_set:
+                results[oid] = (False, f"'{title}' was returned by another request.")
+            elif action == 'renew':
+                results[oid] = (True, f"Successfully renewed '{title}'.")
+            else:
+                results[oid] = (True, f"Successfully returned '{title}'.")
+
+        items = []
+        for loan_id, oid in ids.items():
+            ok, message = results[oid] if oid else (False, "Invalid loan id.")
+            items.append({'loan_id': str(loan_id), 'ok': ok, 'message': message})
+        return items
+
     # ============================================================
     # DELETE LOAN
     # ============================================================
     
     def delete_loan(self):
         if self.return_date is None:
-            return False, f"Cannot delete an unreturned loan. Please return '{self.book.title}' first."
+            return False, f"Cannot delete an unreturned loan. Please return '{self.book_title}' first."
         
-        book_title = self.book.title
+        book_title = self.book_title
         self.delete()
         
         return True, f"Successfully deleted loan record for '{book_title}'."
@@ -151,23 +346,28 @@ class Loan(Document):
     
     def is_returned(self):
         return self.return_date is not None
+
+    @property
+    def book_title(self):
+        # Snapshot first; only loans that predate it look the book up
+        if self.book_snapshot and self.book_snapshot.title:
+            return self.book_snapshot.title
+        book = Book.objects(id=self.book.id).only('title').first()
+        return book.title if book else ''
     
-    def is_overdue(self, due_days=14):
+    def is_overdue(self):
         """
         Check if loan is overdue.
-        
-        Args:
-            due_days (int): Number of days before loan is due (default 14)
-        
+
+        Uses the stored status, plus due_date for loans that fell due since
+        the last mark_overdue_loans() sweep.
+
         Returns:
             bool: True if overdue, False otherwise
         """
-        if self.return_date is not None:
-            return False  # Already returned
-        
-        from datetime import timedelta
-        due_date = self.borrow_date + timedelta(days=due_days)
-        return datetime.now() > due_date
+        if self.status == 'overdue':
+            return True
+        return self.status == 'active' and self.due_date is not None and self.due_date < datetime.now()
     
     def days_borrowed(self):
         if self.return_date is not None:
@@ -175,16 +375,84 @@ class Loan(Document):
         else:
             return (datetime.now() - self.borrow_date).days
     
-    def get_due_date(self, due_days=14):
-        from datetime import timedelta
-        return self.borrow_date + timedelta(days=due_days)
+    def get_due_date(self):
+        return self.due_date
     
     @staticmethod
-    def get_all_overdue_loans(due_days=14):
-        from datetime import timedelta
-        cutoff_date = datetime.now() - timedelta(days=due_days)
-        
-        return Loan.objects(
-            return_date=None,
-            borrow_date__lt=cutoff_date
-        )
\ No newline at end of file
+    def backfill_active():
+        """
+        Set `active` on loans created before the field existed. Returns the count updated.
+
+        The one_active_loan_per_book index is already in place by now
+        (mongoengine builds it on first use), so duplicate unreturned loans
+        for one (borrower, book) -- left by the old check-then-insert race --
+        are closed first: the newest (or the one already active) is kept and
+        the others' copies are put back.
+        """
+        collection = Loan._get_collection()
+        duplicates = collection.aggregate([
+            {'$match': {'return_date': None, '$or': [{'active': {'$exists': False}}, {'active': True}]}},
+            {'$sort': {'active': -1, 'borrow_date': -1}},
+            {'$group': {'_id': {'borrower': '$borrower', 'book': '$book'}, 'loans': {'$push': '$_id'}}},
+            {'$match': {'loans.1': {'$exists': True}}},
+        ])
+        extra_ids, copies = [], {}
+        for group in duplicates:
+            extras = group['loans'][1:]
+            extra_ids += extras
+            copies[group['_id']['book']] = copies.get(group['_id']['book'], 0) + len(extras)
+        updated = 0
+        if extra_ids:
+            updated += collection.update_many(
+                {'_id': {'$in': extra_ids}}, {'$set': {'return_date': datetime.now(), 'active': False}}).modified_count
+            Book.return_copies(copies)
+
+        updated += collection.update_many(
+            {'active': {'$exists': False}, 'return_date': None}, {'$set': {'active': True}}).modified_count
+        updated += collection.update_many(
+            {'active': {'$exists': False}}, {'$set': {'active': False}}).modified_count
+        return updated
+
+    @staticmethod
+    def backfill_book_snapshots():
+        """Store book_snapshot on older loans, resolving all their books in one query."""
+        collection = Loan._get_collection()
+        book_ids = collection.distinct('book', {'book_snapshot': {'$exists': False}})
+        requests = []
+        for book in Book.objects(id__in=book_ids).only('title', 'url', 'authors'):
+            requests.append(UpdateMany(
+                {'book': book.id, 'book_snapshot': {'$exists': False}},
+                {'$set': {'book_snapshot': BookSnapshot.of(book).to_mongo().to_dict()}}))
+        if not requests:
+            return 0
+        return collection.bulk_write(requests, ordered=False).modified_count
+
+    @staticmethod
+    def backfill_due_dates():
+        """Store due_date and status on loans created before those fields existed."""
+        return Loan._get_collection().update_many({'status': {'$exists': False}}, [
+            {'$set': {'due_date': {'$add': ['$borrow_date', LOAN_PERIOD.total_seconds() * 1000]}}},
+            {'$set': {'status': {'$switch': {
+                'branches': [
+                    {'case': {'$ne': [{'$ifNull': ['$return_date', None]}, None]}, 'then': 'returned'},
+                    {'case': {'$lt': ['$due_date', datetime.now()]}, 'then': 'overdue'},
+                ],
+                'default': 'active',
+            }}}},
+        ]).modified_count
+
+    # ============================================================
+    # OVERDUE LOANS
+    # ============================================================
+
+    @staticmethod
+    def mark_overdue_loans(now=None):
+        """Flip every active loan past its due_date to 'overdue' in one update. Returns the count."""
+        now = now or datetime.now()
+        return Loan._get_collection().update_many(
+            {'status': 'active', 'due_date': {'$lt': now}}, {'$set': {'status': 'overdue'}}).modified_count
+
+    @staticmethod
+    def get_all_overdue_loans():
+        """Overdue loans as of the last sweep, longest overdue first (an index scan on status, due_date)."""
+        return Loan.objects(status='overdue').order_by('due_date')
\ No newline at end of file
@@ -0,0 +1,32 @@
+from mongoengine import Document, StringField, IntField, DateTimeField
+from datetime import datetime
+
+
+class Migration(Document):
+    """
+    Marker recording which version of a one-time data step has been applied.
+
+    Fields:
+    - name: Name of the step (e.g. 'seed_books')
+    - version: Version of the step that was last applied
+    - applied_at: When it was applied
+    """
+
+    meta = {'collection': 'migrations'}
+
+    name = StringField(required=True, unique=True)
+    version = IntField(required=True)
+    applied_at = DateTimeField(default=datetime.now)
+
+    @staticmethod
+    def get_version(name):
+        marker = Migration.objects(name=name).first()
+        return marker.version if marker else 0
+
+    @staticmethod
+    def set_version(name, version):
+        Migration.objects(name=name).update_one(
+            set__version=version,
+            set__applied_at=datetime.now(),
+            upsert=True
+        )
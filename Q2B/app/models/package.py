@@ -1,7 +1,10 @@
 from mongoengine import Document, StringField, IntField, FloatField
 
 class Package(Document):
-    meta = {'collection': 'package'}
+    meta = {
+        'collection': 'package',
+        'indexes': ['hotel_name']
+    }
     hotel_name = StringField(max_length=30)
     duration = IntField()
     unit_cost = FloatField()
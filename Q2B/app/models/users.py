@@ -1,9 +1,22 @@
-from mongoengine import Document, StringField 
+from mongoengine import Document, StringField, signals
 from flask_login import UserMixin
+from bson import ObjectId
+from app.cache import TTLCache
+
+# Loaded users for Flask-Login, keyed by id string. Values are snapshots
+# (see User.to_snapshot), so each request still gets its own User object.
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 300
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
 
 class User(UserMixin, Document):
-    meta = {'collection': 'appUsers'}
+    meta = {
+        'collection': 'appUsers',
+        'indexes': [
+            {'fields': ['email'], 'unique': True},
+        ]
+    }
     email = StringField(max_length=30)
     password = StringField()
     name = StringField()
@@ -29,5 +42,35 @@ class User(UserMixin, Document):
         user.avatar = filename
         user.save()
 
+    # ============================================================
+    # SNAPSHOTS (for the user loader cache and the session)
+    # ============================================================
+
+    def to_snapshot(self):
+        """The fields pages read from current_user, without the password hash."""
+        return {'id': str(self.id), 'email': self.email, 'name': self.name, 'avatar': self.avatar}
+
+    @staticmethod
+    def from_snapshot(snapshot):
+        """
+        Rebuild a User from to_snapshot() without a query. It is marked as
+        already stored, so save() only $sets changed fields and never
+        replaces the document (the password is not in the snapshot).
+        """
+        return User._from_son({
+            '_id': ObjectId(snapshot['id']),
+            'email': snapshot['email'],
+            'name': snapshot['name'],
+            'avatar': snapshot['avatar'],
+        }, created=False)
+
+
+def _on_user_changed(sender, document, **kwargs):
+    user_cache.invalidate(lambda key: key == str(document.id))
+
+
+signals.post_save.connect(_on_user_changed, sender=User)
+signals.post_delete.connect(_on_user_changed, sender=User)
+
 
 
@@ -0,0 +1,74 @@
+from concurrent.futures import ProcessPoolExecutor
+import atexit
+import multiprocessing
+import os
+import threading
+
+from werkzeug.security import generate_password_hash
+
+# Hash method and cost, e.g. PASSWORD_HASH_METHOD=pbkdf2:sha256:600000 or scrypt
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'sha256')
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+# Below this many passwords the process pool costs more than it saves
+PARALLEL_HASH_THRESHOLD = 32
+# Workers are started by a fork server (spawn where there is none), never forked
+# from this process: by the time a pool is used it runs logging, pymongo and
+# sweep threads, and a forked child can inherit a lock one of them holds.
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def hash_password(password, method=None):
+    return generate_password_hash(password, method=method or PASSWORD_HASH_METHOD)
+
+
+def new_pool(workers):
+    context = multiprocessing.get_context(START_METHOD)
+    if START_METHOD == 'forkserver':
+        context.set_forkserver_preload(['app.passwords'])  # not __main__, which may build the app
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = new_pool(HASH_WORKERS)
+        return _pool
+
+
+def init_hash_pool():
+    """Create the shared pool at startup rather than from the first import job's thread."""
+    if HASH_WORKERS > 1:
+        get_pool()
+
+
+@atexit.register
+def shutdown_pool():
+    """Stop the shared pool's workers (runs at exit)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def hash_passwords(passwords, method=None, workers=None):
+    """
+    Hash many passwords, spread over worker processes (key derivation is CPU
+    bound and holds the GIL). Results are in the same order as `passwords`.
+    """
+    method = method or PASSWORD_HASH_METHOD
+    workers = HASH_WORKERS if workers is None else workers
+    if workers <= 1 or len(passwords) < PARALLEL_HASH_THRESHOLD:
+        return [hash_password(p, method) for p in passwords]
+
+    pool = get_pool() if workers == HASH_WORKERS else new_pool(workers)
+    try:
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(pool.map(hash_password, passwords, [method] * len(passwords), chunksize=chunksize))
+    finally:
+        if pool is not _pool:
+            pool.shutdown()
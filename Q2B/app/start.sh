@@ -1,2 +1,8 @@
 export FLASK_APP=app.py; export PYTHONPATH=.; export FLASK_DEBUG=1;
+flask migrate-loans
+flask ensure-indexes
+flask seed-books
+# Fingerprinted assets are only used outside debug/development (see static_assets.py)
+if [ "$APP_CONFIG" = "production" ]; then flask build-assets; fi
+flask build-avatars
 flask run --host=0.0.0.0
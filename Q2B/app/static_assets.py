@@ -0,0 +1,104 @@
+# Fingerprinted static assets: `flask build-assets` copies each file under
+# assets/ to instance/assets/<name>.<hash>.<ext> with .gz/.br variants and a
+# manifest. asset_url() links to those copies (served as immutable) and falls
+# back to the normal static URL for anything not in the manifest, and for
+# everything in debug mode or with JINJA_CACHE_ENABLED off (development), so
+# edited CSS/JS is served straight away.
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:  # optional: only .gz variants are built without it
+    brotli = None
+
+ASSET_BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'assets')
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.csv', '.json', '.html', '.txt')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+assets = Blueprint('assets', __name__)
+manifest = {}  # 'css/custom.css' -> 'css/custom.1a2b3c4d5e6f.css'
+
+
+def fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def build_assets(static_folder, build_dir=ASSET_BUILD_DIR):
+    """Hash, copy and precompress every static file. Returns the new manifest."""
+    new_manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for filename in files:
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            base, ext = os.path.splitext(name)
+            hashed = f"{base}.{fingerprint(source)}{ext}"
+            target = os.path.join(build_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+            if ext.lower() in COMPRESSIBLE:
+                with open(source, 'rb') as f:
+                    data = f.read()
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(data, compresslevel=9))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(data))
+            new_manifest[name] = hashed
+
+    with open(os.path.join(build_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(new_manifest, f, indent=1, sort_keys=True)
+    manifest.clear()
+    manifest.update(new_manifest)
+    return new_manifest
+
+
+def load_manifest(build_dir=ASSET_BUILD_DIR):
+    path = os.path.join(build_dir, MANIFEST_NAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest.update(json.load(f))
+
+
+def asset_url(filename):
+    """url_for('static', filename=...) replacement that prefers the fingerprinted copy."""
+    hashed = manifest.get(filename)
+    if hashed is None or current_app.debug or not current_app.config['JINJA_CACHE_ENABLED']:
+        return url_for('static', filename=filename)
+    return url_for('assets.fingerprinted', filename=hashed)
+
+
+@assets.route('/a/<path:filename>')
+def fingerprinted(filename):
+    # Serve the smallest precompressed variant the client accepts
+    accepted = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if accepted[encoding] and os.path.isfile(os.path.join(ASSET_BUILD_DIR, filename + suffix)):
+            response = send_from_directory(ASSET_BUILD_DIR, filename + suffix, max_age=31536000)
+            response.headers['Content-Encoding'] = encoding
+            response.mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            break
+    else:
+        if not os.path.isfile(os.path.join(ASSET_BUILD_DIR, filename)):
+            abort(404)
+        response = send_from_directory(ASSET_BUILD_DIR, filename, max_age=31536000)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_assets(app):
+    load_manifest()
+    app.register_blueprint(assets)
+    app.add_template_global(asset_url)